@@ -0,0 +1,84 @@
+from typing import Any, Callable, Dict, List, Tuple
+
+from prometheus_client import CollectorRegistry
+
+from snyk_metrics import _destroy_client, initialise
+from snyk_metrics.metrics import Counter, Gauge, Histogram
+from tests.sinks import PushgatewayStandIn, UdpSink
+
+from .harness import BenchmarkResult, main, measure, measure_threaded
+
+ITERATIONS = 20000
+THREADS = 4
+BACKENDS = ("none", "prometheus", "pushgateway", "dogstatsd")
+LABELS: Dict[str, Dict[str, Any]] = {
+    "none": {},
+    "one": {"endpoint": "/x"},
+    "many": {f"label_{index}": f"value_{index}" for index in range(8)},
+}
+
+
+def _client_settings(
+    backend: str, gateway: PushgatewayStandIn, statsd_sink: UdpSink
+) -> Dict[str, Any]:
+    settings: Dict[str, Any] = {"lock_registry": False, "prometheus_registry": CollectorRegistry()}
+    if backend in ("prometheus", "pushgateway"):
+        settings["prometheus_enabled"] = True
+    # NOTE: pushing on every update would measure the gateway round trip, not the hot path.
+    if backend == "pushgateway":
+        settings.update(
+            pushgateway_enabled=True,
+            pushgateway_host=gateway.host,
+            pushgateway_port=gateway.port,
+            pushgateway_job_name="benchmark",
+            pushgateway_flush_interval=1.0,
+        )
+    if backend == "dogstatsd":
+        settings.update(
+            dogstatsd_enabled=True,
+            dogstatsd_agent_host=statsd_sink.host,
+            dogstatsd_port=statsd_sink.port,
+        )
+    return settings
+
+
+def _operations(labels_name: str) -> List[Tuple[str, Callable[[], None]]]:
+    labels = LABELS[labels_name]
+    label_names = tuple(labels) or None
+    counter = Counter(f"bench_counter_{labels_name}", "Benchmark", label_names=label_names)
+    gauge = Gauge(f"bench_gauge_{labels_name}", "Benchmark", label_names=label_names)
+    histogram = Histogram(f"bench_histogram_{labels_name}", "Benchmark", label_names=label_names)
+    labels_or_none = labels or None
+    return [
+        ("counter.increment", lambda: counter.increment(labels=labels_or_none)),
+        ("gauge.set_value", lambda: gauge.set_value(1.0, labels=labels_or_none)),
+        ("histogram.set_value", lambda: histogram.set_value(0.1, labels=labels_or_none)),
+    ]
+
+
+def benchmarks() -> List[BenchmarkResult]:
+    results = []
+    with PushgatewayStandIn() as gateway, UdpSink() as statsd_sink:
+        for backend in BACKENDS:
+            initialise(**_client_settings(backend, gateway, statsd_sink))
+            for labels_name in LABELS:
+                for name, operation in _operations(labels_name):
+                    params = {"backend": backend, "labels": labels_name}
+                    results.append(
+                        measure(name, operation, iterations=ITERATIONS, threads=1, **params)
+                    )
+                    results.append(
+                        measure_threaded(
+                            name,
+                            operation,
+                            threads=THREADS,
+                            iterations=ITERATIONS // THREADS,
+                            **params,
+                        )
+                    )
+            _destroy_client()
+    return results
+
+
+if __name__ == "__main__":
+    main(benchmarks)
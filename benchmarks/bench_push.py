@@ -0,0 +1,44 @@
+from typing import List
+
+from prometheus_client import CollectorRegistry, Counter, push_to_gateway
+
+from snyk_metrics.transport import PushgatewayTransport
+from tests.sinks import PushgatewayStandIn
+
+from .harness import BenchmarkResult, main, measure
+
+ITERATIONS = 200
+METRIC_COUNTS = (10, 300)
+
+
+def _registry(count: int) -> CollectorRegistry:
+    registry = CollectorRegistry()
+    for index in range(count):
+        Counter(f"bench_metric_{index}", "Benchmark metric", registry=registry).inc()
+    return registry
+
+
+def benchmarks() -> List[BenchmarkResult]:
+    results = []
+    with PushgatewayStandIn() as gateway:
+        for count in METRIC_COUNTS:
+            registry = _registry(count)
+            transport = PushgatewayTransport(gateway.host, gateway.port, "benchmark")
+
+            def connection_per_push() -> None:
+                push_to_gateway(f"{gateway.host}:{gateway.port}", "benchmark", registry)
+
+            def keepalive() -> None:
+                transport.push(registry)
+
+            for name, func in (
+                ("push.connection_per_push", connection_per_push),
+                ("push.keepalive", keepalive),
+            ):
+                results.append(measure(name, func, iterations=ITERATIONS, metrics=count))
+            transport.close()
+    return results
+
+
+if __name__ == "__main__":
+    main(benchmarks)
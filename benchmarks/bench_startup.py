@@ -0,0 +1,64 @@
+from typing import Any, Dict, List
+
+from prometheus_client import CollectorRegistry
+
+from snyk_metrics.client import Metric, MetricsClient, MetricTypes
+from tests.sinks import PushgatewayStandIn
+
+from .harness import BenchmarkResult, main, measure, reset_client
+
+METRIC_COUNTS = (10, 300)
+
+
+def _metrics(count: int) -> List[Metric]:
+    return [
+        Metric(
+            metric_type=MetricTypes.COUNTER,
+            name=f"bench_metric_{index}",
+            documentation="Benchmark metric",
+            label_names=("endpoint", "method"),
+        )
+        for index in range(count)
+    ]
+
+
+def _client_settings(gateway: PushgatewayStandIn, backend: str) -> Dict[str, Any]:
+    settings: Dict[str, Any] = {"prometheus_registry": CollectorRegistry()}
+    if backend in ("prometheus", "pushgateway"):
+        settings["prometheus_enabled"] = True
+    if backend == "pushgateway":
+        settings.update(
+            pushgateway_enabled=True,
+            pushgateway_host=gateway.host,
+            pushgateway_port=gateway.port,
+            pushgateway_job_name="benchmark",
+        )
+    return settings
+
+
+def benchmarks() -> List[BenchmarkResult]:
+    results = []
+    with PushgatewayStandIn() as gateway:
+        for backend in ("none", "prometheus", "pushgateway"):
+            for count in METRIC_COUNTS:
+
+                def register_one_by_one() -> None:
+                    client = MetricsClient(**_client_settings(gateway, backend))
+                    for metric in _metrics(count):
+                        client.register_metric(metric)
+                    reset_client()
+
+                def register_in_bulk() -> None:
+                    MetricsClient(metrics=_metrics(count), **_client_settings(gateway, backend))
+                    reset_client()
+
+                for name, func in (
+                    ("startup.register_metric", register_one_by_one),
+                    ("startup.register_metrics", register_in_bulk),
+                ):
+                    results.append(measure(name, func, repeat=5, backend=backend, metrics=count))
+    return results
+
+
+if __name__ == "__main__":
+    main(benchmarks)
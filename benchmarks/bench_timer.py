@@ -0,0 +1,56 @@
+import time
+from typing import Any, Dict, List
+
+from prometheus_client import CollectorRegistry
+
+from snyk_metrics import _destroy_client, initialise
+from snyk_metrics.metrics import Histogram
+
+from .harness import BenchmarkResult, main, measure
+
+ITERATIONS = 20000
+LABELS = {"endpoint": "/x", "method": "GET"}
+
+
+def _client_settings(backend: str) -> Dict[str, Any]:
+    settings: Dict[str, Any] = {"lock_registry": False, "prometheus_registry": CollectorRegistry()}
+    if backend == "prometheus":
+        settings["prometheus_enabled"] = True
+    return settings
+
+
+def benchmarks() -> List[BenchmarkResult]:
+    results = []
+    for backend in ("none", "prometheus"):
+        initialise(**_client_settings(backend))
+        histogram = Histogram("bench_duration", "Benchmark", label_names=("endpoint", "method"))
+
+        def baseline() -> None:
+            start = time.time()
+            histogram.observe(time.time() - start, labels=LABELS)
+
+        def context_manager() -> None:
+            with histogram.time(labels=LABELS):
+                pass
+
+        @histogram.time(labels=LABELS)
+        def decorated() -> None:
+            pass
+
+        @histogram.time(labels=LABELS, sample_rate=0.01)
+        def sampled() -> None:
+            pass
+
+        for name, func in (
+            ("timer.hand_written", baseline),
+            ("timer.context_manager", context_manager),
+            ("timer.decorator", decorated),
+            ("timer.decorator_sampled", sampled),
+        ):
+            results.append(measure(name, func, iterations=ITERATIONS, backend=backend))
+        _destroy_client()
+    return results
+
+
+if __name__ == "__main__":
+    main(benchmarks)
@@ -0,0 +1,124 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from snyk_metrics.client import Singleton
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    repeat: int
+    mean_ns: float
+    median_ns: float
+    min_ns: float
+    stdev_ns: float
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def measure(
+    name: str,
+    func: Callable[[], Any],
+    *,
+    iterations: int = 1,
+    repeat: int = 5,
+    setup: Optional[Callable[[], Any]] = None,
+    teardown: Optional[Callable[[], Any]] = None,
+    **params: Any,
+) -> BenchmarkResult:
+    # NOTE: timings are per call, `setup` and `teardown` run around every repetition and
+    # are not measured.
+    timings: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter_ns() - start) / iterations)
+        if teardown is not None:
+            teardown()
+
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        repeat=repeat,
+        mean_ns=statistics.mean(timings),
+        median_ns=statistics.median(timings),
+        min_ns=min(timings),
+        stdev_ns=statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        params=params,
+    )
+
+
+def measure_threaded(
+    name: str,
+    func: Callable[[], Any],
+    *,
+    threads: int,
+    iterations: int = 1,
+    repeat: int = 5,
+    **params: Any,
+) -> BenchmarkResult:
+    # NOTE: timings are the wall time per call, over all the threads: with contention they
+    # grow with the number of threads, without it they shrink.
+    def run() -> None:
+        barrier.wait()
+        for _ in range(iterations):
+            func()
+
+    timings: List[float] = []
+    for _ in range(repeat):
+        barrier = threading.Barrier(threads + 1)
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        start = time.perf_counter_ns()
+        for worker in workers:
+            worker.join()
+        timings.append((time.perf_counter_ns() - start) / (iterations * threads))
+
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        repeat=repeat,
+        mean_ns=statistics.mean(timings),
+        median_ns=statistics.median(timings),
+        min_ns=min(timings),
+        stdev_ns=statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        params={**params, "threads": threads},
+    )
+
+
+def reset_client() -> None:
+    # NOTE: MetricsClient is a singleton, every scenario needs a fresh one.
+    Singleton._instances = {}
+
+
+def main(benchmarks: Callable[[], List[BenchmarkResult]]) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = benchmarks()
+    for result in results:
+        params = ", ".join(f"{key}={value}" for key, value in result.params.items())
+        print(f"{result.name:<40} {params:<50} {result.median_ns:>14,.0f} ns")
+
+    if args.output:
+        report = {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "results": [asdict(result) for result in results],
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
@@ -3,8 +3,12 @@ from typing import List, Optional
 
 from prometheus_client import REGISTRY, CollectorRegistry
 
-from .client import Metric, MetricsClient, Singleton
+from .breaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_BACKOFF
+from .callbacks import DEFAULT_CALLBACK_TIMEOUT
+from .client import DEFAULT_INSTRUMENTATION_SAMPLE_RATE, Metric, MetricsClient, Singleton
 from .exceptions import ClientNotInitialisedError
+from .exposition import DEFAULT_REFRESH_INTERVAL
+from .reporting import DEFAULT_REPORT_INTERVAL
 
 __all__ = [
     "Metric",
@@ -14,6 +18,8 @@ __all__ = [
 
 logger = logging.getLogger(__name__)
 _metrics_client: Optional[MetricsClient] = None
+# NOTE: metrics created before initialise(), registered in bulk when it's called.
+_pending_metrics: List[Metric] = []
 
 
 def initialise(
@@ -26,18 +32,48 @@ def initialise(
     pushgateway_job_name: str = "snyk-metrics-client",
     pushgateway_username: Optional[str] = None,
     pushgateway_password: Optional[str] = None,
+    pushgateway_flush_interval: Optional[float] = None,
+    pushgateway_max_staleness: Optional[float] = None,
+    prometheus_multiprocess_dir: Optional[str] = None,
+    prometheus_http_port: Optional[int] = None,
+    prometheus_http_addr: str = "0.0.0.0",
+    prometheus_http_refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+    pushgateway_keepalive: bool = False,
+    pushgateway_timeout: Optional[float] = None,
+    pushgateway_gzip: bool = False,
+    pushgateway_delta: bool = False,
+    pushgateway_partitions: int = 1,
     dogstatsd_enabled: bool = False,
     dogstatsd_agent_host: str = "datadog",
     dogstatsd_port: int = 8125,
+    dogstatsd_socket_path: Optional[str] = None,
+    dogstatsd_aggregation_enabled: bool = False,
+    dogstatsd_flush_interval: float = 1.0,
+    dogstatsd_max_packet_size: Optional[int] = None,
     prometheus_registry: CollectorRegistry = REGISTRY,
     raise_exceptions: bool = True,
     lock_registry: bool = True,
+    validation: str = "strict",
+    dispatch_enabled: bool = False,
+    dispatch_queue_size: int = 10000,
+    dispatch_overflow_policy: str = "drop_newest",
+    gauge_callback_timeout: float = DEFAULT_CALLBACK_TIMEOUT,
+    circuit_breaker_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+    circuit_breaker_max_backoff: float = DEFAULT_MAX_BACKOFF,
+    error_reporting: str = "log",
+    error_report_interval: float = DEFAULT_REPORT_INTERVAL,
+    self_instrumentation: bool = False,
+    self_instrumentation_sample_rate: float = DEFAULT_INSTRUMENTATION_SAMPLE_RATE,
 ) -> None:
     global _metrics_client
     if _metrics_client is not None:
         logger.warning("MetricsClient already initialised. Different settings will be ignored.")
-    _metrics_client = _metrics_client or MetricsClient(
-        metrics=metrics,
+        return
+
+    explicit_metrics = {id(metric) for metric in metrics or []}
+    pending_metrics = [metric for metric in _pending_metrics if id(metric) not in explicit_metrics]
+    _metrics_client = MetricsClient(
+        metrics=[*(metrics or []), *pending_metrics],
         prometheus_enabled=prometheus_enabled,
         pushgateway_enabled=pushgateway_enabled,
         pushgateway_host=pushgateway_host,
@@ -45,13 +81,40 @@ def initialise(
         pushgateway_job_name=pushgateway_job_name,
         pushgateway_username=pushgateway_username,
         pushgateway_password=pushgateway_password,
+        pushgateway_flush_interval=pushgateway_flush_interval,
+        pushgateway_max_staleness=pushgateway_max_staleness,
+        prometheus_multiprocess_dir=prometheus_multiprocess_dir,
+        prometheus_http_port=prometheus_http_port,
+        prometheus_http_addr=prometheus_http_addr,
+        prometheus_http_refresh_interval=prometheus_http_refresh_interval,
+        pushgateway_keepalive=pushgateway_keepalive,
+        pushgateway_timeout=pushgateway_timeout,
+        pushgateway_gzip=pushgateway_gzip,
+        pushgateway_delta=pushgateway_delta,
+        pushgateway_partitions=pushgateway_partitions,
         dogstatsd_enabled=dogstatsd_enabled,
         dogstatsd_agent_host=dogstatsd_agent_host,
         dogstatsd_port=dogstatsd_port,
+        dogstatsd_socket_path=dogstatsd_socket_path,
+        dogstatsd_aggregation_enabled=dogstatsd_aggregation_enabled,
+        dogstatsd_flush_interval=dogstatsd_flush_interval,
+        dogstatsd_max_packet_size=dogstatsd_max_packet_size,
         prometheus_registry=prometheus_registry,
         raise_exceptions=raise_exceptions,
         lock_registry=lock_registry,
+        validation=validation,
+        dispatch_enabled=dispatch_enabled,
+        dispatch_queue_size=dispatch_queue_size,
+        dispatch_overflow_policy=dispatch_overflow_policy,
+        gauge_callback_timeout=gauge_callback_timeout,
+        circuit_breaker_threshold=circuit_breaker_threshold,
+        circuit_breaker_max_backoff=circuit_breaker_max_backoff,
+        error_reporting=error_reporting,
+        error_report_interval=error_report_interval,
+        self_instrumentation=self_instrumentation,
+        self_instrumentation_sample_rate=self_instrumentation_sample_rate,
     )
+    _pending_metrics.clear()
 
 
 def get_client() -> MetricsClient:
@@ -62,8 +125,15 @@ def get_client() -> MetricsClient:
     return _metrics_client
 
 
+def _defer_registration(metric: Metric) -> None:
+    _pending_metrics.append(metric)
+
+
 def _destroy_client() -> None:
     # NOTE: used in unittest, probably a better approach is needed
     global _metrics_client
+    if _metrics_client is not None:
+        _metrics_client.close()
     _metrics_client = None
+    _pending_metrics.clear()
     Singleton._instances = {}
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+
+
+class CircuitStates(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    # NOTE: opens after `failure_threshold` consecutive failures, calls are then rejected
+    # without touching the sink. Once the backoff elapsed a single call probes the sink: a
+    # success closes the circuit, a failure opens it again for twice as long, up to
+    # `max_backoff`. Transitions are logged, rejected calls only counted.
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+    ) -> None:
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be greater than 0.")
+        if backoff <= 0 or max_backoff < backoff:
+            raise ValueError("backoff must be greater than 0 and lower than max_backoff.")
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state = CircuitStates.CLOSED
+        self.rejected_calls = 0
+        self._failures = 0
+        self._current_backoff = backoff
+        self._retry_at = 0.0
+        self._rejected_calls_at_open = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.state is CircuitStates.CLOSED:
+            return True
+
+        with self._lock:
+            if self.state is CircuitStates.OPEN and time.monotonic() >= self._retry_at:
+                self.state = CircuitStates.HALF_OPEN
+                logger.info(f"{self.name} circuit half-open, probing the sink.")
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self) -> None:
+        # NOTE: lock-free while the sink is healthy.
+        if self.state is CircuitStates.CLOSED and not self._failures:
+            return
+
+        with self._lock:
+            self._failures = 0
+            self._current_backoff = self.backoff
+            if self.state is not CircuitStates.CLOSED:
+                self.state = CircuitStates.CLOSED
+                rejected_calls = self.rejected_calls - self._rejected_calls_at_open
+                logger.warning(
+                    f"{self.name} circuit closed, {rejected_calls} calls were rejected."
+                )
+
+    def record_failure(self, exc: BaseException) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state is CircuitStates.HALF_OPEN:
+                self._current_backoff = min(self._current_backoff * 2, self.max_backoff)
+                self._open()
+                logger.info(
+                    f"{self.name} circuit reopened for {self._current_backoff}s: "
+                    f"{exc.__class__.__name__}: {exc}"
+                )
+            elif self.state is CircuitStates.CLOSED and self._failures >= self.failure_threshold:
+                self._rejected_calls_at_open = self.rejected_calls
+                self._open()
+                logger.warning(
+                    f"{self.name} circuit opened after {self._failures} failures, "
+                    f"retrying in {self._current_backoff}s: {exc.__class__.__name__}: {exc}"
+                )
+
+    def _open(self) -> None:
+        self.state = CircuitStates.OPEN
+        self._retry_at = time.monotonic() + self._current_backoff
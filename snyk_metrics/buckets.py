@@ -0,0 +1,21 @@
+from typing import Tuple
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> Tuple[float, ...]:
+    # NOTE: e.g. exponential_buckets(0.001, 2, 15) covers 1ms to ~16s, with the same relative
+    # precision everywhere, which suits latencies better than linear buckets.
+    if start <= 0:
+        raise ValueError("start must be greater than 0.")
+    if factor <= 1:
+        raise ValueError("factor must be greater than 1.")
+    if count < 1:
+        raise ValueError("count must be greater than 0.")
+    return tuple(start * factor**index for index in range(count))
+
+
+def linear_buckets(start: float, width: float, count: int) -> Tuple[float, ...]:
+    if width <= 0:
+        raise ValueError("width must be greater than 0.")
+    if count < 1:
+        raise ValueError("count must be greater than 0.")
+    return tuple(start + width * index for index in range(count))
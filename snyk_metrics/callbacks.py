@@ -0,0 +1,91 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from queue import Queue
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALLBACK_TIMEOUT = 1.0
+CALLBACK_WORKERS = 2
+
+GaugeCallback = Callable[[], float]
+
+
+class CallbackRunner:
+    # NOTE: callbacks run on daemon worker threads so the collection waits at most
+    # `timeout` for them. A worker busy past its callback's timeout is considered stuck and
+    # replaced, it exits once the callback returns if the pool is then too large.
+    def __init__(self, workers: int = CALLBACK_WORKERS) -> None:
+        self._workers = workers
+        self._deadlines: Dict[threading.Thread, float] = {}
+        self._queue: "Queue[Tuple[GaugeCallback, Future[float], float]]" = Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+
+    def _start(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            healthy = sum(deadline > now for deadline in self._deadlines.values())
+            for _ in range(self._workers - healthy):
+                thread = threading.Thread(
+                    target=self._run, name=f"snyk-metrics-callbacks-{self._started}", daemon=True
+                )
+                self._started += 1
+                self._deadlines[thread] = math.inf
+                thread.start()
+
+    def _run(self) -> None:
+        thread = threading.current_thread()
+        while True:
+            callback, future, timeout = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._deadlines[thread] = time.monotonic() + timeout
+            try:
+                future.set_result(callback())
+            except BaseException as exc:
+                future.set_exception(exc)
+            with self._lock:
+                if len(self._deadlines) > self._workers:
+                    del self._deadlines[thread]
+                    return
+                self._deadlines[thread] = math.inf
+
+    def submit(self, callback: GaugeCallback, timeout: float) -> "Future[float]":
+        now = time.monotonic()
+        if sum(deadline > now for deadline in list(self._deadlines.values())) < self._workers:
+            self._start()
+        future: "Future[float]" = Future()
+        self._queue.put((callback, future, timeout))
+        return future
+
+
+_runner = CallbackRunner()
+
+
+def protect_callback(name: str, callback: GaugeCallback, timeout: float) -> GaugeCallback:
+    # NOTE: a failing or slow callback reports NaN, it must not break the whole collection.
+    # A callback still running from a previous collection isn't called again.
+    running: Optional["Future[float]"] = None
+
+    def protected_callback() -> float:
+        nonlocal running
+        if running is not None and not running.done():
+            logger.warning(f"{name} callback is still running.")
+            return math.nan
+
+        future = _runner.submit(callback, timeout)
+        try:
+            return float(future.result(timeout))
+        except TimeoutError:
+            if not future.cancel():
+                running = future
+            logger.warning(f"{name} callback timed out after {timeout}s.")
+        except Exception as exc:
+            logger.warning(f"{name} callback failed: {exc.__class__.__name__}: {exc}")
+        return math.nan
+
+    return protected_callback
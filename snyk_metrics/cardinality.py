@@ -0,0 +1,86 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+OVERFLOW_LABEL_VALUE = "__other__"
+
+LabelValues = Tuple[str, ...]
+
+
+class SeriesUsage(NamedTuple):
+    series: int
+    bytes: int
+    overflowed: int = 0
+    evicted: int = 0
+
+
+def estimate_series_bytes(series: Iterable[LabelValues]) -> int:
+    # NOTE: the label values are what grows with the cardinality, the size of the backends'
+    # own per-series objects is roughly constant and not included.
+    return sum(
+        sys.getsizeof(label_values) + sum(sys.getsizeof(value) for value in label_values)
+        for label_values in series
+    )
+
+
+class SeriesLimiter:
+    # NOTE: once `max_series` label combinations are known, updates for new combinations go
+    # to a single overflow series with every label set to OVERFLOW_LABEL_VALUE, or, with
+    # `evict`, replace the least recently updated combination.
+    def __init__(self, label_names: Tuple[str, ...], max_series: int, evict: bool = False):
+        if max_series < 1:
+            raise ValueError("max_series must be greater than 0.")
+
+        self.label_names = label_names
+        self.max_series = max_series
+        self.evict = evict
+        self.overflowed = 0
+        self.evicted = 0
+        self._series: "OrderedDict[LabelValues, None]" = OrderedDict()
+        self._overflow_labels = {name: OVERFLOW_LABEL_VALUE for name in label_names}
+        self._lock = threading.Lock()
+
+    def admit(self, labels: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, str]]]:
+        # NOTE: returns the labels to update and the labels of the evicted series, if any.
+        label_values = self.label_values(labels)
+        with self._lock:
+            if label_values in self._series:
+                if self.evict:
+                    self._series.move_to_end(label_values)
+                return labels, None
+
+            if len(self._series) < self.max_series:
+                self._series[label_values] = None
+                return labels, None
+
+            if not self.evict:
+                self.overflowed += 1
+                return self._overflow_labels, None
+
+            evicted_label_values, _ = self._series.popitem(last=False)
+            self._series[label_values] = None
+            self.evicted += 1
+        return labels, dict(zip(self.label_names, evicted_label_values))
+
+    def label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def __contains__(self, label_values: LabelValues) -> bool:
+        return label_values in self._series
+
+    def release(self, labels: Dict[str, Any]) -> None:
+        # NOTE: the series was removed from the backends, e.g. expired, its slot is freed.
+        label_values = self.label_values(labels)
+        with self._lock:
+            self._series.pop(label_values, None)
+
+    def usage(self) -> SeriesUsage:
+        with self._lock:
+            series = list(self._series)
+        return SeriesUsage(
+            series=len(series),
+            bytes=estimate_series_bytes(series),
+            overflowed=self.overflowed,
+            evicted=self.evicted,
+        )
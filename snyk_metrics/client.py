@@ -1,12 +1,32 @@
+import asyncio
 import logging
+import random
+import time
 from dataclasses import dataclass
 from enum import Enum
-from functools import wraps
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from functools import partial, wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.metrics_core import CounterMetricFamily
 
-from .clients.base import BaseClient
+from .breaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_BACKOFF
+from .buckets import exponential_buckets
+from .callbacks import DEFAULT_CALLBACK_TIMEOUT, protect_callback
+from .cardinality import SeriesLimiter, SeriesUsage, estimate_series_bytes
+from .clients.base import BaseClient, MetricDefinition, MetricUpdate
+from .clients.dispatch import QueuedClient
 from .clients.dogstatsd import DogstatsdClient
 from .clients.prometheus import PrometheusClient
 from .exceptions import (
@@ -16,6 +36,8 @@ from .exceptions import (
     MetricTypeMismatchError,
     RegistryLockedError,
 )
+from .exposition import DEFAULT_REFRESH_INTERVAL
+from .reporting import DEFAULT_REPORT_INTERVAL, ErrorReporter
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +55,130 @@ class Metric:
     name: str
     documentation: str
     label_names: Optional[Tuple[str, ...]]
+    # NOTE: how gauge values of different processes are merged in Prometheus multiprocess
+    # mode, one of prometheus_client's Gauge modes, e.g. "all", "max", "livesum".
+    multiprocess_mode: Optional[str] = None
+    # NOTE: max number of label combinations, see SeriesLimiter.
+    max_series: Optional[int] = None
+    evict_series: bool = False
+    # NOTE: seconds after which gauge and histogram series that weren't updated are dropped.
+    series_ttl: Optional[float] = None
+    # NOTE: histogram bucket upper bounds, see snyk_metrics.buckets for generators.
+    buckets: Optional[Tuple[float, ...]] = None
+    compact_buckets: bool = False
+    # NOTE: summary quantiles, estimated over a sliding window of max_age seconds.
+    quantiles: Optional[Tuple[float, ...]] = None
+    max_age: Optional[float] = None
+    age_buckets: Optional[int] = None
+    # NOTE: fraction of the updates that are recorded, the others return immediately.
+    sample_rate: float = 1.0
+
+
+# NOTE: optional Metric fields forwarded to the backends when set.
+METRIC_OPTIONS = (
+    "multiprocess_mode",
+    "series_ttl",
+    "buckets",
+    "compact_buckets",
+    "quantiles",
+    "max_age",
+    "age_buckets",
+)
+
+
+def _metric_options(metric: Metric) -> Dict[str, Any]:
+    options = ((option, getattr(metric, option)) for option in METRIC_OPTIONS)
+    return {option: value for option, value in options if value is not None}
+
+
+class MetricEvent(NamedTuple):
+    metric: Metric
+    value: float
+    labels: Optional[Dict[str, Any]] = None
+    sample_rate: Optional[float] = None
+    # NOTE: the type the update is for, the metric's own type if not set.
+    metric_type: Optional[MetricTypes] = None
+
+
+class ErrorReportingModes(Enum):
+    LOG = "log"
+    SUMMARY = "summary"
+
+
+class ValidationModes(Enum):
+    STRICT = "strict"
+    SAMPLED = "sampled"
+    OFF = "off"
+
+
+# NOTE: in sampled mode only one update out of VALIDATION_SAMPLE_INTERVAL is validated.
+VALIDATION_SAMPLE_INTERVAL = 100
+
+# NOTE: bound once, sampling runs on hot paths.
+_random = random.random
+# NOTE: label dicts with the same keys in a different order have a different shape,
+# the cap keeps the memo bounded if callers build labels in arbitrary orders.
+MAX_MEMOISED_LABEL_SHAPES = 16
+
+
+class _MetricSchema:
+    # NOTE: precompiled at registration so validation doesn't need to sort label names.
+    def __init__(self, metric: Metric) -> None:
+        self.metric = metric
+        self.metric_type = metric.metric_type
+        self.label_names = frozenset(metric.label_names or ())
+        self.label_shapes: Set[Tuple[str, ...]] = set()
+
+
+class MetricsBatch:
+    # NOTE: collects the updates of a `with client.batch():` block, recorded at its end with
+    # MetricsClient.record_many(), even if the block raises.
+    def __init__(self, client: "MetricsClient") -> None:
+        self._client = client
+        self.events: List[MetricEvent] = []
+
+    def __enter__(self) -> "MetricsBatch":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        events, self.events = self.events, []
+        self._client.record_many(events)
+
+    def increment_counter(
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: int = 1,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.events.append(MetricEvent(metric, value, labels, sample_rate, MetricTypes.COUNTER))
+
+    def set_gauge_value(
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.events.append(MetricEvent(metric, value, labels, sample_rate, MetricTypes.GAUGE))
+
+    def set_histogram_value(
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.events.append(MetricEvent(metric, value, labels, sample_rate, MetricTypes.HISTOGRAM))
+
+    def set_summary_value(
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.events.append(MetricEvent(metric, value, labels, sample_rate, MetricTypes.SUMMARY))
 
 
 class Singleton(type):
@@ -46,20 +192,153 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+def _failed_metric_name(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    for arg in (*args[1:2], kwargs.get("metric"), getattr(args[0], "metric", None)):
+        if isinstance(arg, Metric):
+            return arg.name
+    return ""
+
+
 def _exception_handler(func: Callable[..., Any]) -> Callable[..., Any]:
     @wraps(func)
     def inner_func(*args: Any, **kwargs: Any) -> Any:
         try:
-            func(*args, **kwargs)
+            return func(*args, **kwargs)
         except Exception as exc:
             # NOTE: args[0] is the object
             if args[0]._raise_exceptions:
                 raise
-            logger.warning(f"{(exc.__class__.__name__)}: {str(exc)}", stack_info=True)
+            args[0]._suppress(exc, _failed_metric_name(args, kwargs))
 
     return inner_func
 
 
+DEFAULT_INSTRUMENTATION_SAMPLE_RATE = 0.01
+# NOTE: from 1µs to ~0.26s.
+INSTRUMENTATION_BUCKETS = exponential_buckets(0.000001, 4, 10)
+
+CountReader = Callable[[], List[Tuple[List[str], float]]]
+
+
+def _attribute_count(obj: Any, attribute: str) -> List[Tuple[List[str], float]]:
+    return [([], getattr(obj, attribute))]
+
+
+class Instrumentation:
+    # NOTE: the library's own metrics. Timings are recorded for a sample of the updates,
+    # through emitters bound once, without validation, and exported like the application's
+    # metrics. Levels kept by the backends are read by callback gauges, counts are exposed
+    # as counters to Prometheus, the instance being a collector. Neither costs the updates.
+    def __init__(
+        self, client: "MetricsClient", backend_names: List[str], sample_rate: float
+    ) -> None:
+        self.sample_rate = sample_rate
+        validation = Metric(
+            metric_type=MetricTypes.HISTOGRAM,
+            name="snyk_metrics_validation_seconds",
+            documentation="Time spent validating a sample of the metric updates.",
+            label_names=None,
+            buckets=INSTRUMENTATION_BUCKETS,
+            compact_buckets=True,
+        )
+        emit = Metric(
+            metric_type=MetricTypes.HISTOGRAM,
+            name="snyk_metrics_emit_seconds",
+            documentation="Time spent by each backend in a sample of the metric updates.",
+            label_names=("backend",),
+            buckets=INSTRUMENTATION_BUCKETS,
+            compact_buckets=True,
+        )
+        self._client = client
+        metrics = [validation, emit]
+        queue_depth = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="snyk_metrics_queue_depth",
+            documentation="Queued backend calls.",
+            label_names=("backend",),
+        )
+        if client._dispatch_clients:
+            metrics.append(queue_depth)
+        client.register_metrics(metrics)
+
+        self.validation_emitters = client.bind_metric(validation) or ()
+        self.emit_emitters = {
+            name: client.bind_metric(emit, {"backend": name}) or () for name in backend_names
+        }
+        for name, dispatch_client in client._dispatch_clients.items():
+            client.set_gauge_callback(
+                queue_depth,
+                lambda dispatch_client=dispatch_client: dispatch_client.queue_depth,
+                {"backend": name},
+            )
+
+    def describe(self) -> Iterable[CounterMetricFamily]:
+        return [family for family, _ in self._counters()]
+
+    def collect(self) -> Iterable[CounterMetricFamily]:
+        families = []
+        for family, counts in self._counters():
+            for label_values, count in counts():
+                family.add_metric(label_values, count)
+            families.append(family)
+        return families
+
+    def _counters(self) -> List[Tuple[CounterMetricFamily, CountReader]]:
+        client = self._client
+        counters: List[Tuple[CounterMetricFamily, CountReader]] = []
+        if client._dispatch_clients:
+            counters.append(
+                (
+                    CounterMetricFamily(
+                        "snyk_metrics_dropped_events",
+                        "Dropped backend calls.",
+                        labels=("backend",),
+                    ),
+                    lambda: [
+                        ([name], dispatch_client.dropped_events)
+                        for name, dispatch_client in client._dispatch_clients.items()
+                    ],
+                )
+            )
+        dogstatsd_client = client._dogstatsd_client
+        if dogstatsd_client is not None:
+            counters.append(
+                (
+                    CounterMetricFamily(
+                        "snyk_metrics_dogstatsd_packets",
+                        "Dogstatsd packets.",
+                        labels=("outcome",),
+                    ),
+                    lambda: [
+                        (["sent"], dogstatsd_client.total_packets_sent),
+                        (["dropped"], dogstatsd_client.total_packets_dropped),
+                    ],
+                )
+            )
+        prometheus_client = client._prometheus_client
+        if prometheus_client is not None and prometheus_client.pushgateway_enabled:
+            for name, documentation, attribute in (
+                ("snyk_metrics_pushgateway_pushes", "Pushgateway pushes.", "pushes"),
+                ("snyk_metrics_pushgateway_push_seconds", "Time spent pushing.", "push_seconds"),
+                ("snyk_metrics_pushgateway_pushed_bytes", "Bytes pushed.", "pushed_bytes"),
+            ):
+                counters.append(
+                    (
+                        CounterMetricFamily(name, documentation),
+                        partial(_attribute_count, prometheus_client, attribute),
+                    )
+                )
+        return counters
+
+    def observe_validation(self, seconds: float) -> None:
+        for emit in self.validation_emitters:
+            emit(seconds)
+
+    def observe_emit(self, backend_name: str, seconds: float) -> None:
+        for emit in self.emit_emitters[backend_name]:
+            emit(seconds)
+
+
 class MetricsClient(metaclass=Singleton):
     def __init__(
         self,
@@ -72,14 +351,51 @@ class MetricsClient(metaclass=Singleton):
         pushgateway_job_name: str = "snyk-metrics-client",
         pushgateway_username: Optional[str] = None,
         pushgateway_password: Optional[str] = None,
+        pushgateway_flush_interval: Optional[float] = None,
+        pushgateway_max_staleness: Optional[float] = None,
+        prometheus_multiprocess_dir: Optional[str] = None,
+        prometheus_http_port: Optional[int] = None,
+        prometheus_http_addr: str = "0.0.0.0",
+        prometheus_http_refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        pushgateway_keepalive: bool = False,
+        pushgateway_timeout: Optional[float] = None,
+        pushgateway_gzip: bool = False,
+        pushgateway_delta: bool = False,
+        pushgateway_partitions: int = 1,
         dogstatsd_enabled: bool = False,
         dogstatsd_agent_host: str = "datadog",
         dogstatsd_port: int = 8125,
+        dogstatsd_socket_path: Optional[str] = None,
+        dogstatsd_aggregation_enabled: bool = False,
+        dogstatsd_flush_interval: float = 1.0,
+        dogstatsd_max_packet_size: Optional[int] = None,
         prometheus_registry: CollectorRegistry = REGISTRY,
         raise_exceptions: bool = True,
         lock_registry: bool = False,
+        validation: str = "strict",
+        dispatch_enabled: bool = False,
+        dispatch_queue_size: int = 10000,
+        dispatch_overflow_policy: str = "drop_newest",
+        gauge_callback_timeout: float = DEFAULT_CALLBACK_TIMEOUT,
+        circuit_breaker_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        circuit_breaker_max_backoff: float = DEFAULT_MAX_BACKOFF,
+        error_reporting: str = "log",
+        error_report_interval: float = DEFAULT_REPORT_INTERVAL,
+        self_instrumentation: bool = False,
+        self_instrumentation_sample_rate: float = DEFAULT_INSTRUMENTATION_SAMPLE_RATE,
     ):
         self._raise_exceptions = raise_exceptions
+        # NOTE: in summary mode suppressed exceptions are counted and periodically logged,
+        # the counts are exposed by the Prometheus registry. Self-instrumentation counts them
+        # in any mode.
+        summarise = ErrorReportingModes(error_reporting) is ErrorReportingModes.SUMMARY
+        self._error_reporter = (
+            ErrorReporter(error_report_interval, summarise=summarise)
+            if summarise or self_instrumentation
+            else None
+        )
+        self._prometheus_registry = prometheus_registry
+        self._gauge_callback_timeout = gauge_callback_timeout
         self._prometheus_client = (
             PrometheusClient(
                 pushgateway_enabled=pushgateway_enabled,
@@ -89,48 +405,216 @@ class MetricsClient(metaclass=Singleton):
                 pushgateway_username=pushgateway_username,
                 pushgateway_password=pushgateway_password,
                 registry=prometheus_registry,
+                pushgateway_flush_interval=pushgateway_flush_interval,
+                pushgateway_max_staleness=pushgateway_max_staleness,
+                multiprocess_dir=prometheus_multiprocess_dir,
+                pushgateway_keepalive=pushgateway_keepalive,
+                pushgateway_timeout=pushgateway_timeout,
+                pushgateway_gzip=pushgateway_gzip,
+                pushgateway_delta=pushgateway_delta,
+                pushgateway_partitions=pushgateway_partitions,
+                circuit_breaker_threshold=circuit_breaker_threshold,
+                circuit_breaker_max_backoff=circuit_breaker_max_backoff,
+                http_port=prometheus_http_port,
+                http_addr=prometheus_http_addr,
+                http_refresh_interval=prometheus_http_refresh_interval,
+                instrumented=self_instrumentation,
+                on_series_expired=self._release_series,
             )
             if prometheus_enabled
             else None
         )
         self._dogstatsd_client = (
-            DogstatsdClient(dogstatsd_agent_host, dogstatsd_port) if dogstatsd_enabled else None
+            DogstatsdClient(
+                dogstatsd_agent_host,
+                dogstatsd_port,
+                socket_path=dogstatsd_socket_path,
+                aggregation_enabled=dogstatsd_aggregation_enabled,
+                flush_interval=dogstatsd_flush_interval,
+                max_packet_size=dogstatsd_max_packet_size,
+                circuit_breaker_threshold=circuit_breaker_threshold,
+                circuit_breaker_max_backoff=circuit_breaker_max_backoff,
+            )
+            if dogstatsd_enabled
+            else None
+        )
+        backends: Dict[str, Optional[BaseClient]] = {
+            "prometheus": self._prometheus_client,
+            "dogstatsd": self._dogstatsd_client,
+        }
+        # NOTE: with dispatch enabled updates are queued per backend and performed by worker
+        # threads, so a slow backend never blocks the caller.
+        self._dispatch_clients: Dict[str, QueuedClient] = (
+            {
+                name: QueuedClient(
+                    backend,
+                    name,
+                    max_queue_size=dispatch_queue_size,
+                    overflow_policy=dispatch_overflow_policy,
+                )
+                for name, backend in backends.items()
+                if backend is not None
+            }
+            if dispatch_enabled
+            else {}
         )
-        self._enabled_clients: List[BaseClient] = list(
-            filter(None, (self._prometheus_client, self._dogstatsd_client))
+        self._enabled_clients: List[BaseClient] = (
+            list(self._dispatch_clients.values())
+            if dispatch_enabled
+            else list(filter(None, backends.values()))
         )
+        self._backend_names = [name for name, backend in backends.items() if backend is not None]
 
+        self._validation = ValidationModes(validation)
+        self._validation_count = 0
+        self._schemas: Dict[str, _MetricSchema] = {}
+        self._series_limiters: Dict[str, SeriesLimiter] = {}
         self.registry: Dict[str, Metric] = {}
         self.lock_registry = False
-        for metric in metrics or []:
-            self.register_metric(metric)
+        self._instrumentation: Optional[Instrumentation] = None
+        if metrics:
+            self.register_metrics(metrics)
+        if self_instrumentation:
+            self._instrumentation = Instrumentation(
+                self, self._backend_names, self_instrumentation_sample_rate
+            )
         self.lock_registry = lock_registry
+        if self._error_reporter is not None and self._prometheus_client is not None:
+            prometheus_registry.register(self._error_reporter)
+        if self._instrumentation is not None and self._prometheus_client is not None:
+            prometheus_registry.register(self._instrumentation)
 
-    @_exception_handler
+    @property
+    def dropped_events(self) -> Dict[str, int]:
+        return {name: client.dropped_events for name, client in self._dispatch_clients.items()}
+
+    def _suppress(self, exc: Exception, metric_name: str) -> None:
+        if self._error_reporter is not None:
+            self._error_reporter.report(metric_name, exc)
+            if self._error_reporter.summarise:
+                return
+        logger.warning(f"{(exc.__class__.__name__)}: {str(exc)}", stack_info=True)
+
+    def _update(
+        self,
+        method_name: str,
+        metric: Metric,
+        metric_type: MetricTypes,
+        labels: Optional[Dict[str, Any]],
+        value: Any,
+        sample_rate: Optional[float],
+        sampled: bool = False,
+    ) -> None:
+        if sample_rate is None:
+            sample_rate = metric.sample_rate
+        if not sampled and sample_rate < 1 and _random() >= sample_rate:
+            return
+        instrumentation = self._instrumentation
+        if instrumentation is not None and _random() < instrumentation.sample_rate:
+            return self._instrumented_update(
+                instrumentation, method_name, metric, metric_type, labels, value, sample_rate
+            )
+        self._validate_metric(metric, metric_type, labels)
+        if self._series_limiters and labels:
+            labels = self._limit_series(metric, labels)
+        for client in self._enabled_clients:
+            getattr(client, method_name)(metric.name, labels, value, sample_rate)
+
+    def _instrumented_update(
+        self,
+        instrumentation: Instrumentation,
+        method: str,
+        metric: Metric,
+        metric_type: MetricTypes,
+        labels: Optional[Dict[str, Any]],
+        value: Any,
+        sample_rate: float,
+    ) -> None:
+        # NOTE: same as _update, timing the validation and every backend.
+        start = time.perf_counter()
+        self._validate_metric(metric, metric_type, labels)
+        instrumentation.observe_validation(time.perf_counter() - start)
+        if self._series_limiters and labels:
+            labels = self._limit_series(metric, labels)
+        for backend_name, client in zip(self._backend_names, self._enabled_clients):
+            if isinstance(client, QueuedClient):
+                client.timed(
+                    method,
+                    partial(instrumentation.observe_emit, backend_name),
+                    metric.name,
+                    labels,
+                    value,
+                    sample_rate,
+                )
+                continue
+            start = time.perf_counter()
+            getattr(client, method)(metric.name, labels, value, sample_rate)
+            instrumentation.observe_emit(backend_name, time.perf_counter() - start)
+
+    # NOTE: not wrapped, its exceptions are handled once, by the calling method.
     def _validate_metric(
         self, metric: Metric, metric_type: MetricTypes, labels: Optional[Dict[str, Any]]
     ) -> None:
-        registered_metric = self.registry.get(metric.name)
-        label_names = tuple(labels.keys()) if labels else None
+        if self._validation is not ValidationModes.STRICT:
+            if self._validation is ValidationModes.OFF:
+                return
+            self._validation_count += 1
+            if self._validation_count % VALIDATION_SAMPLE_INTERVAL:
+                return
 
-        if registered_metric is None:
+        schema = self._schemas.get(metric.name)
+        if schema is None:
             raise MetricNotRegisteredError(metric.name)
 
-        if registered_metric.metric_type is not metric_type:
+        if schema.metric_type is not metric_type:
             raise MetricTypeMismatchError(
-                f"{registered_metric.name} type is {registered_metric.metric_type.value}, "
-                f"not {metric_type.value}."
+                f"{metric.name} type is {schema.metric_type.value}, not {metric_type.value}."
             )
 
-        sorted_registered_label_names = sorted(
-            registered_metric.label_names if registered_metric.label_names else []
-        )
-        sorted_label_names = sorted(label_names if label_names else [])
-        if sorted_registered_label_names != sorted_label_names:
+        label_shape = tuple(labels) if labels else ()
+        if label_shape in schema.label_shapes:
+            return
+
+        if frozenset(label_shape) != schema.label_names:
             raise MetricLabelMismatchError(
-                f"{registered_metric.name} required labels: {registered_metric.label_names}"
+                f"{metric.name} required labels: {schema.metric.label_names}"
             )
 
+        if len(schema.label_shapes) < MAX_MEMOISED_LABEL_SHAPES:
+            schema.label_shapes.add(label_shape)
+
+    def _add_to_registry(self, metric: Metric) -> None:
+        if metric.max_series is not None and metric.label_names:
+            self._series_limiters[metric.name] = SeriesLimiter(
+                metric.label_names, metric.max_series, metric.evict_series
+            )
+        self._schemas[metric.name] = _MetricSchema(metric)
+        self.registry[metric.name] = metric
+
+    def _limit_series(self, metric: Metric, labels: Dict[str, Any]) -> Dict[str, Any]:
+        limiter = self._series_limiters.get(metric.name)
+        if limiter is None:
+            return labels
+
+        labels, evicted_labels = limiter.admit(labels)
+        if evicted_labels is not None:
+            for client in self._enabled_clients:
+                client.remove_series(metric.metric_type.value, metric.name, evicted_labels)
+        return labels
+
+    def _release_series(self, name: str, labels: Dict[str, str]) -> None:
+        limiter = self._series_limiters.get(name)
+        if limiter is not None:
+            limiter.release(labels)
+
+    def series_usage(self) -> Dict[str, SeriesUsage]:
+        usage = {name: limiter.usage() for name, limiter in self._series_limiters.items()}
+        if self._prometheus_client is not None:
+            for name in self.registry.keys() - usage.keys():
+                series = self._prometheus_client.series(name)
+                usage[name] = SeriesUsage(len(series), estimate_series_bytes(series))
+        return usage
+
     @_exception_handler
     def register_metric(self, metric: Metric) -> None:
         if self.lock_registry:
@@ -147,30 +631,218 @@ class MetricsClient(metaclass=Singleton):
                 metric.name,
                 metric.documentation,
                 metric.label_names,
+                **_metric_options(metric),
             )
-        self.registry[metric.name] = metric
+        self._add_to_registry(metric)
         return
 
+    @_exception_handler
+    def register_metrics(self, metrics: List[Metric]) -> None:
+        # NOTE: backends register the metrics in bulk, e.g. pushing to the Pushgateway only
+        # once. Duplicates are skipped and reported once the others are registered.
+        if self.lock_registry:
+            raise RegistryLockedError(
+                "metrics can't be registered after initialising the registry."
+            )
+
+        names: Set[str] = set()
+        new_metrics: List[Metric] = []
+        duplicates: List[Metric] = []
+        for metric in metrics:
+            if metric.name in self.registry or metric.name in names:
+                duplicates.append(metric)
+                continue
+            names.add(metric.name)
+            new_metrics.append(metric)
+
+        if self._enabled_clients and new_metrics:
+            definitions = [
+                MetricDefinition(
+                    metric.metric_type.value,
+                    metric.name,
+                    metric.documentation,
+                    metric.label_names,
+                    _metric_options(metric),
+                )
+                for metric in new_metrics
+            ]
+            for client in self._enabled_clients:
+                client.register_metrics(definitions)
+        for metric in new_metrics:
+            self._add_to_registry(metric)
+
+        for metric in duplicates:
+            exc = MetricAlreadyRegisteredError(metric.name)
+            if self._raise_exceptions:
+                raise exc
+            self._suppress(exc, metric.name)
+
+    @_exception_handler
+    def bind_metric(
+        self, metric: Metric, labels: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Callable[[Any], None], ...]:
+        self._validate_metric(metric, metric.metric_type, labels)
+        limiter = self._series_limiters.get(metric.name)
+        if limiter is not None and labels:
+            return (self._bind_limited(metric, labels, limiter),)
+        return self._bind_emitters(metric, labels)
+
+    def _bind_emitters(
+        self, metric: Metric, labels: Optional[Dict[str, Any]]
+    ) -> Tuple[Callable[[Any], None], ...]:
+        return tuple(
+            client.bind(metric.metric_type.value, metric.name, labels, metric.sample_rate)
+            for client in self._enabled_clients
+        )
+
+    def _bind_limited(
+        self, metric: Metric, labels: Dict[str, Any], limiter: SeriesLimiter
+    ) -> Callable[[Any], None]:
+        # NOTE: every update through the handle goes through the limiter, like the unbound
+        # ones. A series evicted or expired since it was bound is admitted again, the handle
+        # is then bound to it anew, or to the overflow series.
+        label_values = limiter.label_values(labels)
+        bound_labels = self._limit_series(metric, labels)
+        emitters = self._bind_emitters(metric, bound_labels)
+
+        def emit(value: Any) -> None:
+            nonlocal bound_labels, emitters
+            known = label_values in limiter
+            admitted = self._limit_series(metric, labels)
+            if not known and (admitted is labels or admitted is not bound_labels):
+                bound_labels = admitted
+                emitters = self._bind_emitters(metric, admitted)
+            for update in emitters:
+                update(value)
+
+        return emit
+
     @_exception_handler
     def increment_counter(
-        self, metric: Metric, labels: Optional[Dict[str, Any]] = None, value: int = 1
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: int = 1,
+        sample_rate: Optional[float] = None,
     ) -> None:
-        self._validate_metric(metric, MetricTypes.COUNTER, labels)
-        for client in self._enabled_clients:
-            client.increment_counter(metric.name, labels, value)
+        self._update("increment_counter", metric, MetricTypes.COUNTER, labels, value, sample_rate)
 
     @_exception_handler
     def set_gauge_value(
-        self, metric: Metric, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
     ) -> None:
-        self._validate_metric(metric, MetricTypes.GAUGE, labels)
-        for client in self._enabled_clients:
-            client.set_gauge_value(metric.name, labels, value)
+        self._update("set_gauge_value", metric, MetricTypes.GAUGE, labels, value, sample_rate)
 
     @_exception_handler
     def set_histogram_value(
-        self, metric: Metric, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self._update(
+            "set_histogram_value", metric, MetricTypes.HISTOGRAM, labels, value, sample_rate
+        )
+
+    @_exception_handler
+    def set_summary_value(
+        self,
+        metric: Metric,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self._update("set_summary_value", metric, MetricTypes.SUMMARY, labels, value, sample_rate)
+
+    @_exception_handler
+    def _observe_sampled(
+        self, metric: Metric, value: float, labels: Optional[Dict[str, Any]], sample_rate: float
+    ) -> None:
+        # NOTE: for timers, which already sampled the call to skip timing it.
+        method_name = (
+            "set_summary_value"
+            if metric.metric_type is MetricTypes.SUMMARY
+            else "set_histogram_value"
+        )
+        self._update(
+            method_name, metric, metric.metric_type, labels, value, sample_rate, sampled=True
+        )
+
+    @_exception_handler
+    def record_many(self, events: Iterable[MetricEvent]) -> None:
+        # NOTE: every metric and label names combination is validated once, then each
+        # backend gets the whole batch, e.g. for a single push or datagram. When exceptions
+        # are suppressed invalid events are reported one by one and the others recorded.
+        updates: List[MetricUpdate] = []
+        validated: Set[Tuple[str, MetricTypes, FrozenSet[str]]] = set()
+        for metric, value, labels, sample_rate, metric_type in events:
+            if sample_rate is None:
+                sample_rate = metric.sample_rate
+            if sample_rate < 1 and _random() >= sample_rate:
+                continue
+            metric_type = metric_type or metric.metric_type
+            shape = (metric.name, metric_type, frozenset(labels) if labels else frozenset())
+            if shape not in validated:
+                try:
+                    self._validate_metric(metric, metric_type, labels)
+                except Exception as exc:
+                    if self._raise_exceptions:
+                        raise
+                    self._suppress(exc, metric.name)
+                    continue
+                validated.add(shape)
+            if self._series_limiters and labels:
+                labels = self._limit_series(metric, labels)
+            updates.append(
+                MetricUpdate(metric_type.value, metric.name, labels, value, sample_rate)
+            )
+
+        if updates:
+            for client in self._enabled_clients:
+                client.record_many(updates)
+
+    def batch(self) -> MetricsBatch:
+        return MetricsBatch(self)
+
+    @_exception_handler
+    def set_gauge_callback(
+        self,
+        metric: Metric,
+        callback: Callable[[], float],
+        labels: Optional[Dict[str, Any]] = None,
     ) -> None:
-        self._validate_metric(metric, MetricTypes.HISTOGRAM, labels)
+        self._validate_metric(metric, MetricTypes.GAUGE, labels)
+        callback = protect_callback(metric.name, callback, self._gauge_callback_timeout)
         for client in self._enabled_clients:
-            client.set_histogram_value(metric.name, labels, value)
+            client.set_gauge_callback(metric.name, labels, callback)
+
+    @_exception_handler
+    def flush(self) -> None:
+        for client in self._enabled_clients:
+            client.flush()
+
+    @_exception_handler
+    def close(self) -> None:
+        for client in self._enabled_clients:
+            client.close()
+        if self._error_reporter is not None:
+            self._error_reporter.flush()
+        if self._prometheus_client is not None:
+            for collector in (self._error_reporter, self._instrumentation):
+                if collector is None:
+                    continue
+                try:
+                    self._prometheus_registry.unregister(collector)
+                except KeyError:
+                    pass
+
+    async def aflush(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    async def aclose(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -1,23 +1,62 @@
 from abc import ABCMeta, abstractmethod
-from typing import Any, Dict, Optional, Tuple
+from functools import partial
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+
+class MetricDefinition(NamedTuple):
+    metric_type: str
+    name: str
+    documentation: str
+    label_names: Optional[Tuple[str, ...]]
+    options: Mapping[str, Any]
+
+
+class MetricUpdate(NamedTuple):
+    metric_type: str
+    name: str
+    labels: Optional[Dict[str, Any]]
+    value: float
+    sample_rate: float = 1.0
 
 
 class BaseClient(metaclass=ABCMeta):
     @abstractmethod
     def increment_counter(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: int = 1
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: int = 1,
+        sample_rate: float = 1.0,
     ) -> None:
         raise NotImplementedError
 
     @abstractmethod
     def set_gauge_value(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
     ) -> None:
         raise NotImplementedError
 
     @abstractmethod
     def set_histogram_value(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_summary_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
     ) -> None:
         raise NotImplementedError
 
@@ -28,5 +67,50 @@ class BaseClient(metaclass=ABCMeta):
         name: str,
         documentation: str,
         label_names: Optional[Tuple[str, ...]] = None,
+        **options: Any,
     ) -> None:
         raise NotImplementedError
+
+    def register_metrics(self, metrics: List[MetricDefinition]) -> None:
+        for metric_type, name, documentation, label_names, options in metrics:
+            self.register_metric(metric_type, name, documentation, label_names, **options)
+
+    def bind(
+        self,
+        metric_type: str,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: float = 1.0,
+    ) -> Callable[[Any], None]:
+        # NOTE: backends override this to resolve labels once and skip per-call lookups.
+        update = self._update_methods()[metric_type]
+        return partial(update, name, labels, sample_rate=sample_rate)
+
+    def record_many(self, updates: List[MetricUpdate]) -> None:
+        # NOTE: backends override this to send the whole batch at once.
+        update_methods = self._update_methods()
+        for metric_type, name, labels, value, sample_rate in updates:
+            update_methods[metric_type](name, labels, value, sample_rate)
+
+    def _update_methods(self) -> Dict[str, Callable[..., None]]:
+        return {
+            "counter": self.increment_counter,
+            "gauge": self.set_gauge_value,
+            "histogram": self.set_histogram_value,
+            "summary": self.set_summary_value,
+        }
+
+    def set_gauge_callback(
+        self, name: str, labels: Optional[Dict[str, Any]], callback: Callable[[], float]
+    ) -> None:
+        # NOTE: backends call the callback when they need the value instead of being updated.
+        return None
+
+    def remove_series(self, metric_type: str, name: str, labels: Dict[str, Any]) -> None:
+        return None
+
+    def flush(self) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from enum import Enum
+from functools import partial
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .base import BaseClient, MetricDefinition, MetricUpdate
+
+logger = logging.getLogger(__name__)
+
+DispatchEvent = Tuple[Optional[Callable[..., Any]], Tuple[Any, ...]]
+
+_STOP: DispatchEvent = (None, ())
+
+
+def _timed_call(
+    observe: Callable[[float], None], func: Callable[..., Any], args: Tuple[Any, ...]
+) -> None:
+    start = time.perf_counter()
+    func(*args)
+    observe(time.perf_counter() - start)
+
+
+class OverflowPolicies(Enum):
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+
+
+class QueuedClient(BaseClient):
+    # NOTE: callers only enqueue the backend call, a worker thread performs it. Labels are
+    # passed by reference and must not be mutated after the call. Registration stays
+    # synchronous as it creates the collectors needed to bind metrics.
+    def __init__(
+        self,
+        client: BaseClient,
+        name: str,
+        max_queue_size: int = 10000,
+        overflow_policy: str = "drop_newest",
+    ) -> None:
+        self.client = client
+        self.name = name
+        self.overflow_policy = OverflowPolicies(overflow_policy)
+        self.dropped_events = 0
+        self._dropped_lock = threading.Lock()
+        self._queue: "Queue[DispatchEvent]" = Queue(maxsize=max_queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name=f"snyk-metrics-{name}-dispatch", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            func, args = self._queue.get()
+            try:
+                if func is None:
+                    return
+                func(*args)
+            except Exception as exc:
+                logger.warning(f"{self.name} dispatch failed: {exc.__class__.__name__}: {exc}")
+            finally:
+                self._queue.task_done()
+
+    def _count_dropped(self) -> None:
+        with self._dropped_lock:
+            self.dropped_events += 1
+
+    def _dispatch(self, func: Callable[..., Any], *args: Any) -> None:
+        event = (func, args)
+        if self.overflow_policy is OverflowPolicies.BLOCK:
+            self._queue.put(event)
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except Full:
+                if self.overflow_policy is OverflowPolicies.DROP_NEWEST:
+                    self._count_dropped()
+                    return
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                continue
+            self._queue.task_done()
+            self._count_dropped()
+
+    def timed(self, method_name: str, observe: Callable[[float], None], *args: Any) -> None:
+        # NOTE: for self-instrumentation, the worker times the backend call, not the caller.
+        self._dispatch(_timed_call, observe, getattr(self.client, method_name), args)
+
+    def bind(
+        self,
+        metric_type: str,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: float = 1.0,
+    ) -> Callable[[Any], None]:
+        return partial(
+            self._dispatch, self.client.bind(metric_type, name, labels, sample_rate=sample_rate)
+        )
+
+    def increment_counter(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: int = 1,
+        sample_rate: float = 1.0,
+    ) -> None:
+        self._dispatch(self.client.increment_counter, name, labels, value, sample_rate)
+
+    def set_gauge_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        self._dispatch(self.client.set_gauge_value, name, labels, value, sample_rate)
+
+    def set_histogram_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        self._dispatch(self.client.set_histogram_value, name, labels, value, sample_rate)
+
+    def set_summary_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        self._dispatch(self.client.set_summary_value, name, labels, value, sample_rate)
+
+    def record_many(self, updates: List[MetricUpdate]) -> None:
+        self._dispatch(self.client.record_many, updates)
+
+    def set_gauge_callback(
+        self, name: str, labels: Optional[Dict[str, Any]], callback: Callable[[], float]
+    ) -> None:
+        self.client.set_gauge_callback(name, labels, callback)
+
+    def remove_series(self, metric_type: str, name: str, labels: Dict[str, Any]) -> None:
+        self._dispatch(self.client.remove_series, metric_type, name, labels)
+
+    def register_metric(
+        self,
+        metric_type: str,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        **options: Any,
+    ) -> None:
+        self.client.register_metric(metric_type, name, documentation, label_names, **options)
+
+    def register_metrics(self, metrics: List[MetricDefinition]) -> None:
+        self.client.register_metrics(metrics)
+
+    def flush(self) -> None:
+        self._queue.join()
+        self.client.flush()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.client.close()
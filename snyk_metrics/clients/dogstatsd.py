@@ -1,31 +1,414 @@
-from typing import Dict, Optional, Tuple
+import logging
+import math
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from datadog import initialize, statsd
+from datadog.dogstatsd.base import DogStatsd
 
-from .base import BaseClient
+from snyk_metrics.breaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_BACKOFF, CircuitBreaker
+from snyk_metrics.flusher import BackgroundFlusher
+
+from .base import BaseClient, MetricUpdate
+
+logger = logging.getLogger(__name__)
+
+# NOTE: the largest UDP payload that fits a standard 1500 bytes MTU without fragmenting.
+DEFAULT_MAX_PACKET_SIZE = 1432
+# NOTE: Unix domain sockets don't fragment, the agent accepts datagrams up to 8KB.
+DEFAULT_MAX_UDS_PACKET_SIZE = 8192
+
+AggregationKey = Tuple[str, Optional[Tuple[str, ...]]]
+
+DOGSTATSD_METRIC_TYPE_MAP = {
+    "counter": "c",
+    "gauge": "g",
+    "histogram": "h",
+    "summary": "d",
+}
+
+
+def _format_tags(labels: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    return [f"{key}:{value}" for key, value in labels.items()] if labels else None
+
+
+def _aggregation_key(name: str, labels: Optional[Dict[str, Any]]) -> AggregationKey:
+    return name, tuple(f"{key}:{value}" for key, value in labels.items()) if labels else None
+
+
+def _estimate_size(key: AggregationKey) -> int:
+    # NOTE: name, value, type and separators, a precise size is computed when packing.
+    name, tags = key
+    return len(name) + 16 + (sum(len(tag) + 1 for tag in tags) + 2 if tags else 0)
+
+
+def _serialize(
+    key: AggregationKey,
+    value: float,
+    metric_type: str,
+    sample_rate: float = 1.0,
+    namespace: Optional[str] = None,
+    constant_tags: Tuple[str, ...] = (),
+) -> bytes:
+    name, tags = key
+    if namespace:
+        name = f"{namespace}.{name}"
+    line = f"{name}:{value}|{metric_type}"
+    if sample_rate < 1:
+        line = f"{line}|@{sample_rate}"
+    if tags or constant_tags:
+        line = f"{line}|#{','.join((*(tags or ()), *constant_tags))}"
+    return line.encode("utf-8")
+
+
+def _pack(lines: Iterable[bytes], max_packet_size: int) -> Iterator[bytes]:
+    packet: List[bytes] = []
+    size = 0
+    for line in lines:
+        if packet and size + len(line) > max_packet_size:
+            yield b"\n".join(packet)
+            packet, size = [], 0
+        packet.append(line)
+        size += len(line) + 1
+    if packet:
+        yield b"\n".join(packet)
 
 
 class DogstatsdClient(BaseClient):
-    def __init__(self, agent_host: str, port: int) -> None:
-        initialize(statsd_host=agent_host, statsd_port=port)
+    def __init__(
+        self,
+        agent_host: str,
+        port: int,
+        socket_path: Optional[str] = None,
+        aggregation_enabled: bool = False,
+        flush_interval: float = 1.0,
+        max_packet_size: Optional[int] = None,
+        circuit_breaker_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        circuit_breaker_max_backoff: float = DEFAULT_MAX_BACKOFF,
+    ) -> None:
+        # NOTE: a dedicated instance, the global `datadog.statsd` may be configured and used
+        # by other code in the same process. With a socket path the host and port are ignored.
+        self._statsd = DogStatsd(host=agent_host, port=port, socket_path=socket_path)
+        # NOTE: DogStatsd resets its packet counts whenever it sends its own telemetry, they
+        # are accumulated before, so they can be exported as counters.
+        self._statsd_packets_sent = 0
+        self._statsd_packets_dropped = 0
+        self._reset_statsd_telemetry = self._statsd._reset_telemetry
+        setattr(self._statsd, "_reset_telemetry", self._accumulate_statsd_telemetry)
+        # NOTE: lines built by this client carry the namespace and the constant tags, e.g.
+        # from DD_ENV, DD_SERVICE and DD_VERSION, like the ones DogStatsd builds.
+        self._serialize = partial(
+            _serialize,
+            namespace=self._statsd.namespace,
+            constant_tags=tuple(self._statsd.constant_tags or ()),
+        )
+
+        self.socket_path = socket_path
+        self.aggregation_enabled = aggregation_enabled
+        self.max_packet_size = max_packet_size or (
+            DEFAULT_MAX_UDS_PACKET_SIZE if socket_path else DEFAULT_MAX_PACKET_SIZE
+        )
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        # NOTE: only guards the packets sent by this client, DogStatsd's own methods already
+        # drop what they fail to send.
+        self._breaker = CircuitBreaker(
+            "Dogstatsd",
+            failure_threshold=circuit_breaker_threshold,
+            max_backoff=circuit_breaker_max_backoff,
+        )
+        self._lock = threading.Lock()
+        self._counters: Dict[AggregationKey, float] = {}
+        self._gauges: Dict[AggregationKey, float] = {}
+        self._histograms: Dict[Tuple[AggregationKey, float], List[float]] = {}
+        self._distributions: Dict[Tuple[AggregationKey, float], List[float]] = {}
+        self._buffered_size = 0
+        self._flush_interval = flush_interval
+        self._callbacks: Dict[AggregationKey, Callable[[], float]] = {}
+        self._callback_flusher: Optional[BackgroundFlusher] = None
+        # NOTE: aggregates mark the flusher dirty, so the final flush on close or at exit
+        # sends them. max_staleness equal to the interval makes it run on every tick for the
+        # callback gauges, flushing an empty buffer is a no-op.
+        self._flusher = (
+            BackgroundFlusher(
+                "snyk-metrics-dogstatsd",
+                self._flush_aggregates,
+                flush_interval,
+                max_staleness=flush_interval,
+            )
+            if aggregation_enabled
+            else None
+        )
+
+    def _aggregate_counter(
+        self, key: AggregationKey, value: float, sample_rate: float = 1.0
+    ) -> None:
+        # NOTE: sampled counters are aggregated as their estimated totals.
+        if sample_rate < 1:
+            value = value / sample_rate
+        with self._lock:
+            current = self._counters.get(key)
+            if current is None:
+                self._buffered_size += _estimate_size(key)
+                self._counters[key] = value
+            else:
+                self._counters[key] = current + value
+        self._check_buffer_size()
+
+    def _aggregate_gauge(
+        self, key: AggregationKey, value: float, sample_rate: float = 1.0
+    ) -> None:
+        with self._lock:
+            if key not in self._gauges:
+                self._buffered_size += _estimate_size(key)
+            self._gauges[key] = value
+        self._check_buffer_size()
+
+    def _aggregate_histogram(
+        self, key: AggregationKey, value: float, sample_rate: float = 1.0
+    ) -> None:
+        with self._lock:
+            self._buffered_size += _estimate_size(key)
+            self._histograms.setdefault((key, sample_rate), []).append(value)
+        self._check_buffer_size()
+
+    def _aggregate_distribution(
+        self, key: AggregationKey, value: float, sample_rate: float = 1.0
+    ) -> None:
+        with self._lock:
+            self._buffered_size += _estimate_size(key)
+            self._distributions.setdefault((key, sample_rate), []).append(value)
+        self._check_buffer_size()
+
+    def _check_buffer_size(self) -> None:
+        if self._flusher is None:
+            return
+        if self._buffered_size >= self.max_packet_size:
+            self._flusher.request_flush()
+        else:
+            self._flusher.mark_dirty()
+
+    def _sample_callbacks(self) -> List[Tuple[AggregationKey, float]]:
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        samples = ((key, callback()) for key, callback in callbacks)
+        return [(key, value) for key, value in samples if not math.isnan(value)]
+
+    def _accumulate_statsd_telemetry(self) -> None:
+        self._statsd_packets_sent += self._statsd.packets_sent
+        self._statsd_packets_dropped += self._statsd.packets_dropped
+        self._reset_statsd_telemetry()
+
+    @property
+    def total_packets_sent(self) -> int:
+        # NOTE: the packets sent by this client, aggregates and batches, and by DogStatsd.
+        return int(self.packets_sent + self._statsd_packets_sent + self._statsd.packets_sent)
+
+    @property
+    def total_packets_dropped(self) -> int:
+        return int(
+            self.packets_dropped + self._statsd_packets_dropped + self._statsd.packets_dropped
+        )
+
+    def _flush_callbacks(self) -> None:
+        for (name, tags), value in self._sample_callbacks():
+            self._statsd.gauge(metric=name, tags=list(tags) if tags else None, value=value)
+
+    def _flush_aggregates(self) -> None:
+        sampled_gauges = self._sample_callbacks() if self._callbacks else []
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            histograms, self._histograms = self._histograms, {}
+            distributions, self._distributions = self._distributions, {}
+            self._buffered_size = 0
+
+        lines: List[bytes] = []
+        lines.extend(self._serialize(key, value, "c") for key, value in counters.items())
+        lines.extend(self._serialize(key, value, "g") for key, value in gauges.items())
+        lines.extend(self._serialize(key, value, "g") for key, value in sampled_gauges)
+        for (key, sample_rate), values in histograms.items():
+            lines.extend(self._serialize(key, value, "h", sample_rate) for value in values)
+        for (key, sample_rate), values in distributions.items():
+            lines.extend(self._serialize(key, value, "d", sample_rate) for value in values)
+        if lines:
+            self._send_packets(list(_pack(lines, self.max_packet_size)))
+
+    def _send_packets(self, packets: List[bytes]) -> None:
+        if not self._breaker.allow():
+            self.packets_dropped += len(packets)
+            return
+
+        try:
+            sock = self._statsd.get_socket()
+        except OSError as exc:
+            self.packets_dropped += len(packets)
+            self._breaker.record_failure(exc)
+            return
+
+        failure: Optional[OSError] = None
+        for packet in packets:
+            try:
+                sock.send(packet)
+                self.packets_sent += 1
+            except OSError as exc:
+                self.packets_dropped += 1
+                failure = exc
+        if failure is not None:
+            self._breaker.record_failure(failure)
+        else:
+            self._breaker.record_success()
+
+    def _send_sampled(
+        self, metric_type: str, key: AggregationKey, sample_rate: float, value: float
+    ) -> None:
+        # NOTE: the rate is added to the line here, the DogStatsd methods would sample the
+        # already sampled calls again.
+        self._send_packets([self._serialize(key, value, metric_type, sample_rate)])
+
+    def _aggregate_methods(self) -> Dict[str, Callable[..., None]]:
+        return {
+            "counter": self._aggregate_counter,
+            "gauge": self._aggregate_gauge,
+            "histogram": self._aggregate_histogram,
+            "summary": self._aggregate_distribution,
+        }
+
+    def record_many(self, updates: List[MetricUpdate]) -> None:
+        if self._flusher is not None:
+            aggregate_methods = self._aggregate_methods()
+            for metric_type, name, labels, value, sample_rate in updates:
+                aggregate_methods[metric_type](_aggregation_key(name, labels), value, sample_rate)
+            return
+
+        # NOTE: packed like the aggregates, in as few datagrams as possible.
+        lines = [
+            self._serialize(
+                _aggregation_key(name, labels),
+                value,
+                DOGSTATSD_METRIC_TYPE_MAP[metric_type],
+                sample_rate,
+            )
+            for metric_type, name, labels, value, sample_rate in updates
+        ]
+        if lines:
+            self._send_packets(list(_pack(lines, self.max_packet_size)))
+
+    def flush(self) -> None:
+        if self._flusher is not None:
+            self._flusher.flush()
+        if self._callback_flusher is not None:
+            self._callback_flusher.flush()
+
+    def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.stop()
+        if self._callback_flusher is not None:
+            self._callback_flusher.stop()
+        self._statsd.close_socket()
+
+    def bind(
+        self,
+        metric_type: str,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: float = 1.0,
+    ) -> Callable[[Any], None]:
+        if self._flusher is not None:
+            aggregate = self._aggregate_methods()[metric_type]
+            return partial(aggregate, _aggregation_key(name, labels), sample_rate=sample_rate)
+
+        if sample_rate < 1:
+            return partial(
+                self._send_sampled,
+                DOGSTATSD_METRIC_TYPE_MAP[metric_type],
+                _aggregation_key(name, labels),
+                sample_rate,
+            )
+
+        update_methods: Dict[str, Callable[..., None]] = {
+            "counter": self._statsd.increment,
+            "gauge": self._statsd.gauge,
+            "histogram": self._statsd.histogram,
+            # NOTE: distributions are aggregated by Datadog across hosts, with global
+            # percentiles, which is what summaries' quantiles are for.
+            "summary": self._statsd.distribution,
+        }
+        return partial(update_methods[metric_type], name, tags=_format_tags(labels))
 
     def increment_counter(
-        self, name: str, labels: Optional[Dict[str, str]] = None, value: int = 1
+        self,
+        name: str,
+        labels: Optional[Dict[str, str]] = None,
+        value: int = 1,
+        sample_rate: float = 1.0,
     ) -> None:
-        tags = [f"{key}:{value}" for key, value in labels.items()] if labels else None
-        statsd.increment(metric=name, tags=tags, value=value)
+        if self._flusher is not None:
+            self._aggregate_counter(_aggregation_key(name, labels), value, sample_rate)
+            return
+        if sample_rate < 1:
+            self._send_sampled("c", _aggregation_key(name, labels), sample_rate, value)
+            return
+        self._statsd.increment(metric=name, tags=_format_tags(labels), value=value)
 
     def set_gauge_value(
-        self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, str]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
     ) -> None:
-        tags = [f"{key}:{value}" for key, value in labels.items()] if labels else None
-        statsd.gauge(metric=name, tags=tags, value=value)
+        if self._flusher is not None:
+            self._aggregate_gauge(_aggregation_key(name, labels), value, sample_rate)
+            return
+        if sample_rate < 1:
+            self._send_sampled("g", _aggregation_key(name, labels), sample_rate, value)
+            return
+        self._statsd.gauge(metric=name, tags=_format_tags(labels), value=value)
 
     def set_histogram_value(
-        self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, str]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        if self._flusher is not None:
+            self._aggregate_histogram(_aggregation_key(name, labels), value, sample_rate)
+            return
+        if sample_rate < 1:
+            self._send_sampled("h", _aggregation_key(name, labels), sample_rate, value)
+            return
+        self._statsd.histogram(metric=name, tags=_format_tags(labels), value=value)
+
+    def set_summary_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, str]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        if self._flusher is not None:
+            self._aggregate_distribution(_aggregation_key(name, labels), value, sample_rate)
+            return
+        if sample_rate < 1:
+            self._send_sampled("d", _aggregation_key(name, labels), sample_rate, value)
+            return
+        self._statsd.distribution(metric=name, tags=_format_tags(labels), value=value)
+
+    def set_gauge_callback(
+        self, name: str, labels: Optional[Dict[str, Any]], callback: Callable[[], float]
     ) -> None:
-        tags = [f"{key}:{value}" for key, value in labels.items()] if labels else None
-        statsd.histogram(metric=name, tags=tags, value=value)
+        # NOTE: sampled on every flush interval, by the aggregation flusher if enabled.
+        with self._lock:
+            self._callbacks[_aggregation_key(name, labels)] = callback
+            if self._flusher is None and self._callback_flusher is None:
+                self._callback_flusher = BackgroundFlusher(
+                    "snyk-metrics-dogstatsd-callbacks",
+                    self._flush_callbacks,
+                    self._flush_interval,
+                    max_staleness=self._flush_interval,
+                )
 
     def register_metric(
         self,
@@ -33,5 +416,6 @@ class DogstatsdClient(BaseClient):
         name: str,
         documentation: str,
         label_names: Optional[Tuple[str, ...]] = None,
+        **options: Any,
     ) -> None:
         pass
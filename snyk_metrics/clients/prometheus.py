@@ -1,5 +1,17 @@
-from typing import Any, Dict, Optional, Tuple, Union
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
+import prometheus_client.metrics as prometheus_metrics
 from prometheus_client import (
     REGISTRY,
     CollectorRegistry,
@@ -8,12 +20,37 @@ from prometheus_client import (
     Histogram,
     Summary,
     push_to_gateway,
+    pushadd_to_gateway,
 )
-from prometheus_client.exposition import basic_auth_handler
+from prometheus_client.metrics_core import Metric as MetricFamily
+from prometheus_client.samples import Sample
+from prometheus_client.utils import floatToGoString
 
+from snyk_metrics.breaker import DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_BACKOFF, CircuitBreaker
 from snyk_metrics.exceptions import MetricNotRegisteredError
+from snyk_metrics.exposition import DEFAULT_REFRESH_INTERVAL, ExpositionServer
+from snyk_metrics.flusher import BackgroundFlusher
+from snyk_metrics.multiprocess import (
+    enable_multiprocess_mode,
+    exposition_registry,
+    mark_process_dead,
+)
+from snyk_metrics.sketch import (
+    DEFAULT_AGE_BUCKETS,
+    DEFAULT_MAX_AGE,
+    DEFAULT_QUANTILES,
+    SlidingQuantiles,
+)
+from snyk_metrics.transport import (
+    DEFAULT_POOL_SIZE,
+    DEFAULT_PUSH_TIMEOUT,
+    PushgatewayTransport,
+    push_handler,
+)
 
-from .base import BaseClient
+from .base import BaseClient, MetricDefinition, MetricUpdate
+
+logger = logging.getLogger(__name__)
 
 PrometheusMetric = Union[Counter, Gauge, Histogram, Summary]
 
@@ -25,6 +62,198 @@ PROMETHEUS_METRIC_CLASS_MAP = {
 }
 
 
+class SeriesExpiry:
+    # NOTE: children not written to for `ttl` seconds are removed when the metric is
+    # collected, by a scrape or a push. Writes only store a timestamp in the child, a gauge
+    # repeatedly set to the same value stays alive. `on_expire` gets the removed labels.
+    def __init__(
+        self, ttl: float, on_expire: Optional[Callable[[Dict[str, str]], None]] = None
+    ) -> None:
+        self.ttl = ttl
+        self.on_expire = on_expire
+
+    def expire(self, metric: Union["ExpiringGauge", "ExpiringHistogram"]) -> None:
+        now = time.monotonic()
+        with metric._lock:
+            children = list(metric._metrics.items())
+
+        for label_values, child in children:
+            if now - getattr(child, "_updated_at", now) < self.ttl:
+                continue
+            metric.remove(*label_values)
+            if self.on_expire is not None:
+                self.on_expire(dict(zip(metric._labelnames, label_values)))
+
+
+class ExpiringGauge(Gauge):
+    def __init__(
+        self,
+        *args: Any,
+        series_ttl: Optional[float] = None,
+        on_expire: Optional[Callable[[Dict[str, str]], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._expiry = SeriesExpiry(series_ttl, on_expire) if series_ttl is not None else None
+        super().__init__(*args, **kwargs)
+
+    def _metric_init(self) -> None:
+        super()._metric_init()
+        self._updated_at = time.monotonic()
+
+    def inc(self, amount: float = 1) -> None:
+        super().inc(amount)
+        self._updated_at = time.monotonic()
+
+    def dec(self, amount: float = 1) -> None:
+        super().dec(amount)
+        self._updated_at = time.monotonic()
+
+    def set(self, value: float) -> None:
+        super().set(value)
+        self._updated_at = time.monotonic()
+
+    def set_function(self, f: Callable[[], float]) -> None:
+        # NOTE: evaluated on every collection, the series is always up to date.
+        super().set_function(f)
+        self._updated_at = math.inf
+
+    def collect(self) -> Iterable[MetricFamily]:
+        if self._expiry is not None:
+            self._expiry.expire(self)
+        return super().collect()
+
+
+class ExpiringHistogram(Histogram):
+    def __init__(
+        self,
+        *args: Any,
+        series_ttl: Optional[float] = None,
+        on_expire: Optional[Callable[[Dict[str, str]], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._expiry = SeriesExpiry(series_ttl, on_expire) if series_ttl is not None else None
+        super().__init__(*args, **kwargs)
+
+    def _metric_init(self) -> None:
+        super()._metric_init()
+        self._updated_at = time.monotonic()
+
+    def observe(self, amount: float, exemplar: Optional[Dict[str, str]] = None) -> None:
+        super().observe(amount, exemplar)
+        self._updated_at = time.monotonic()
+
+    def collect(self) -> Iterable[MetricFamily]:
+        if self._expiry is not None:
+            self._expiry.expire(self)
+        return super().collect()
+
+
+class CompactHistogram(ExpiringHistogram):
+    # NOTE: bucket counts are kept in a single array under one lock and the bucket is found
+    # by bisection, instead of a value object with its own lock per bucket and a linear
+    # scan. Exemplars aren't supported.
+    def _metric_init(self) -> None:
+        self._created = time.time()
+        self._values_lock = threading.Lock()
+        self._bucket_counts = array("d", [0.0]) * len(self._upper_bounds)
+        self._sum_value = 0.0
+        self._updated_at = time.monotonic()
+
+    def observe(self, amount: float, exemplar: Optional[Dict[str, str]] = None) -> None:
+        self._raise_if_not_observable()  # type: ignore[no-untyped-call]
+        index = bisect_left(self._upper_bounds, amount)
+        with self._values_lock:
+            self._bucket_counts[index] += 1
+            self._sum_value += amount
+        self._updated_at = time.monotonic()
+
+    def _child_samples(self) -> Iterable[Sample]:
+        with self._values_lock:
+            bucket_counts = self._bucket_counts.tolist()
+            sum_value = self._sum_value
+
+        samples = []
+        count = 0.0
+        for upper_bound, bucket_count in zip(self._upper_bounds, bucket_counts):
+            count += bucket_count
+            le = floatToGoString(upper_bound)  # type: ignore[no-untyped-call]
+            samples.append(Sample("_bucket", {"le": le}, count, None, None))
+        samples.append(Sample("_count", {}, count, None, None))
+        if self._upper_bounds[0] >= 0:
+            samples.append(Sample("_sum", {}, sum_value, None, None))
+        if getattr(prometheus_metrics, "_use_created", True):
+            samples.append(Sample("_created", {}, self._created, None, None))
+        return tuple(samples)
+
+
+class QuantileSummary(Summary):
+    # NOTE: prometheus_client's Summary only exports the count and sum, the quantiles are
+    # estimated over a sliding window by a t-digest per label set.
+    def __init__(
+        self,
+        *args: Any,
+        quantiles: Tuple[float, ...] = DEFAULT_QUANTILES,
+        max_age: float = DEFAULT_MAX_AGE,
+        age_buckets: int = DEFAULT_AGE_BUCKETS,
+        **kwargs: Any,
+    ) -> None:
+        self._quantile_options: Dict[str, Any] = {
+            "quantiles": tuple(quantiles),
+            "max_age": max_age,
+            "age_buckets": age_buckets,
+        }
+        super().__init__(*args, **kwargs)
+        self._kwargs.update(self._quantile_options)
+
+    def _metric_init(self) -> None:
+        super()._metric_init()
+        self._sliding_quantiles = SlidingQuantiles(**self._quantile_options)
+
+    def observe(self, amount: float) -> None:
+        super().observe(amount)
+        self._sliding_quantiles.add(amount)
+
+    def _child_samples(self) -> Iterable[Sample]:
+        quantile_samples = (
+            Sample(
+                "",
+                {"quantile": floatToGoString(quantile)},  # type: ignore[no-untyped-call]
+                value,
+                None,
+                None,
+            )
+            for quantile, value in self._sliding_quantiles.values()
+        )
+        return (*quantile_samples, *super()._child_samples())
+
+
+EXPIRING_METRIC_CLASS_MAP = {
+    "gauge": ExpiringGauge,
+    "histogram": ExpiringHistogram,
+}
+
+PUSH_WORKERS = 4
+
+
+class RegistrySubset(CollectorRegistry):
+    # NOTE: exposes some of the collectors of another registry, for partial pushes.
+    def __init__(self, collectors: List[Any]) -> None:
+        super().__init__(auto_describe=False)
+        self._subset = collectors
+
+    def collect(self) -> Iterable[MetricFamily]:
+        for collector in self._subset:
+            yield from collector.collect()
+
+
+PROMETHEUS_UPDATE_METHOD_MAP = {
+    "counter": "inc",
+    "gauge": "set",
+    "histogram": "observe",
+    "summary": "observe",
+}
+
+
 class PrometheusClient(BaseClient):
     def __init__(
         self,
@@ -35,46 +264,295 @@ class PrometheusClient(BaseClient):
         pushgateway_username: Optional[str] = None,
         pushgateway_password: Optional[str] = None,
         registry: Optional[CollectorRegistry] = None,
+        pushgateway_flush_interval: Optional[float] = None,
+        pushgateway_max_staleness: Optional[float] = None,
+        multiprocess_dir: Optional[str] = None,
+        pushgateway_keepalive: bool = False,
+        pushgateway_timeout: Optional[float] = None,
+        pushgateway_gzip: bool = False,
+        pushgateway_delta: bool = False,
+        pushgateway_partitions: int = 1,
+        circuit_breaker_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        circuit_breaker_max_backoff: float = DEFAULT_MAX_BACKOFF,
+        http_port: Optional[int] = None,
+        http_addr: str = "0.0.0.0",
+        http_refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        instrumented: bool = False,
+        on_series_expired: Optional[Callable[[str, Dict[str, str]], None]] = None,
     ):
+        if pushgateway_partitions < 1:
+            raise ValueError("pushgateway_partitions must be greater than 0.")
+
         self.pushgateway_enabled = pushgateway_enabled
         self.pushgateway_host = pushgateway_host if pushgateway_enabled else None
         self.pushgateway_port = pushgateway_port
         self.pushgateway_job_name = pushgateway_job_name if pushgateway_enabled else None
         self.pushgateway_username = pushgateway_username
         self.pushgateway_password = pushgateway_password
+        self.pushgateway_partitions = pushgateway_partitions
+        self.on_series_expired = on_series_expired
         self._registry = registry or REGISTRY
+        self.multiprocess_dir = multiprocess_dir
+        if multiprocess_dir is not None:
+            enable_multiprocess_mode(multiprocess_dir)
+        # NOTE: in multiprocess mode the values of all the processes are merged for exposition.
+        self.exposition_registry = (
+            exposition_registry(multiprocess_dir)
+            if multiprocess_dir is not None
+            else self._registry
+        )
+        self.http_server = (
+            ExpositionServer(self.exposition_registry, http_port, http_addr, http_refresh_interval)
+            if http_port is not None
+            else None
+        )
+        # NOTE: without a flush interval every update is pushed synchronously.
+        self._flusher = (
+            BackgroundFlusher(
+                "snyk-metrics-pushgateway",
+                self._push_to_gateway,
+                pushgateway_flush_interval,
+                pushgateway_max_staleness,
+            )
+            if pushgateway_enabled and pushgateway_flush_interval is not None
+            else None
+        )
+        # NOTE: built once rather than on every push.
+        self._push_options: Dict[str, Any] = {}
+        self._payload = threading.local()
+        if pushgateway_username or pushgateway_password or pushgateway_gzip or instrumented:
+            self._push_options["handler"] = push_handler(
+                pushgateway_username,
+                pushgateway_password,
+                pushgateway_gzip,
+                payload=self._payload if instrumented else None,
+            )
+        if pushgateway_timeout is not None:
+            self._push_options["timeout"] = pushgateway_timeout
+        push_workers = min(pushgateway_partitions, PUSH_WORKERS)
+        self._transport = (
+            PushgatewayTransport(
+                pushgateway_host or "localhost",
+                pushgateway_port or 9091,
+                pushgateway_job_name or "",
+                username=pushgateway_username,
+                password=pushgateway_password,
+                timeout=pushgateway_timeout or DEFAULT_PUSH_TIMEOUT,
+                gzip_enabled=pushgateway_gzip,
+                pool_size=max(DEFAULT_POOL_SIZE, push_workers),
+            )
+            if pushgateway_enabled and pushgateway_keepalive
+            else None
+        )
+        # NOTE: names of the metrics updated since the last push, only tracked for delta
+        # pushes. Collectors registered by others, and metrics whose series expire, are part
+        # of every push. The first push replaces the whole group, e.g. a previous run's.
+        self._changed_metrics: Optional[Set[str]] = (
+            set() if pushgateway_enabled and pushgateway_delta else None
+        )
+        self._expiring_metrics: Set[str] = set()
+        self._full_push_due = True
+        self._changed_lock = threading.Lock()
+        self._collector_names: Dict[Any, str] = {}
+        self._push_executor = (
+            ThreadPoolExecutor(max_workers=push_workers, thread_name_prefix="snyk-metrics-push")
+            if pushgateway_enabled and pushgateway_partitions > 1
+            else None
+        )
+        self._breaker = CircuitBreaker(
+            "Pushgateway",
+            failure_threshold=circuit_breaker_threshold,
+            max_backoff=circuit_breaker_max_backoff,
+        )
+        # NOTE: cumulative push statistics, for self-instrumentation.
+        self.pushes = 0
+        self.push_seconds = 0.0
+        self.pushed_bytes = 0
+        self._push_stats_lock = threading.Lock()
+        self._push_lock = threading.Lock()
+        self._push_state_lock = threading.Lock()
+        self._push_requested = False
+        self._push_running = False
 
-    def _push_to_gateway(self) -> None:
-        if not self.pushgateway_username and not self.pushgateway_password:
-            push_to_gateway(
+    def _push(
+        self,
+        registry: CollectorRegistry,
+        method: str = "PUT",
+        grouping_key: Optional[Dict[str, str]] = None,
+    ) -> None:
+        start = time.perf_counter()
+        if self._transport is not None:
+            size = self._transport.push(registry, method, grouping_key)
+        else:
+            push = pushadd_to_gateway if method == "POST" else push_to_gateway
+            options = (
+                self._push_options
+                if grouping_key is None
+                else {**self._push_options, "grouping_key": grouping_key}
+            )
+            push(
                 f"{self.pushgateway_host}:{self.pushgateway_port}",
                 self.pushgateway_job_name,
-                self._registry,
+                registry,
+                **options,
             )
+            size = getattr(self._payload, "size", 0)
+        duration = time.perf_counter() - start
+
+        with self._push_stats_lock:
+            self.pushes += 1
+            self.push_seconds += duration
+            self.pushed_bytes += size
+
+        return None
+
+    def _push_to_gateway(self) -> None:
+        # NOTE: while the circuit is open pushes are skipped, the metrics are still pushed
+        # once it closes: by the flusher, kept dirty, or by the next update.
+        if not self._breaker.allow():
+            if self._flusher is not None:
+                self._flusher.mark_dirty()
             return None
 
-        def authenticated_handler(
-            url: Any, method: Any, timeout: Any, headers: Any, data: Any
-        ) -> Any:
-            return basic_auth_handler(
-                url,
-                method,
-                timeout,
-                headers,
-                data,
-                self.pushgateway_username,
-                self.pushgateway_password,
-            )
+        try:
+            self._send_push()
+        except Exception as exc:
+            self._breaker.record_failure(exc)
+            raise
+        self._breaker.record_success()
 
-        push_to_gateway(
-            f"{self.pushgateway_host}:{self.pushgateway_port}",
-            self.pushgateway_job_name,
-            self._registry,
-            handler=authenticated_handler,
-        )
+        return None
+
+    def _send_push(self) -> None:
+        if self._changed_metrics is None and self._push_executor is None:
+            self._push(self.exposition_registry)
+            return None
+
+        changed = self._take_changed_metrics()
+        try:
+            self._push_partitions(changed)
+        except BaseException:
+            if changed is None:
+                with self._changed_lock:
+                    self._full_push_due = True
+            else:
+                self._mark_changed(changed)
+            raise
 
         return None
 
+    def _mark_changed(self, names: Iterable[str]) -> None:
+        if self._changed_metrics is not None:
+            with self._changed_lock:
+                self._changed_metrics.update(names)
+
+    def _take_changed_metrics(self) -> Optional[Set[str]]:
+        if self._changed_metrics is None:
+            return None
+        with self._changed_lock:
+            changed, self._changed_metrics = self._changed_metrics, set()
+            full_push, self._full_push_due = self._full_push_due, False
+            expiring = set(self._expiring_metrics)
+        # NOTE: nothing changed, the push is a staleness refresh of every metric.
+        if full_push or not changed:
+            return None
+        return changed | expiring
+
+    def _partitions(self, changed: Optional[Set[str]]) -> List[List[Any]]:
+        registry = self.exposition_registry
+        with registry._lock:
+            collectors = list(registry._collector_to_names.items())
+
+        # NOTE: a metric always lands in the same partition, so each grouping key of the
+        # gateway keeps holding the same metrics from one push to the next.
+        partitions: List[List[Any]] = [[] for _ in range(self.pushgateway_partitions)]
+        for collector, names in collectors:
+            name = self._collector_names.get(collector)
+            if changed is not None and name is not None and name not in changed:
+                continue
+            key = name or min(names, default="")
+            partitions[zlib.crc32(key.encode("utf-8")) % len(partitions)].append(collector)
+        return partitions
+
+    def _push_partitions(self, changed: Optional[Set[str]]) -> None:
+        # NOTE: delta pushes use POST, which only replaces the pushed metrics in the group.
+        method = "PUT" if changed is None else "POST"
+        pushes = [
+            (
+                {"partition": str(index)} if self.pushgateway_partitions > 1 else None,
+                RegistrySubset(collectors),
+            )
+            for index, collectors in enumerate(self._partitions(changed))
+            if collectors
+        ]
+        if self._push_executor is None or len(pushes) < 2:
+            for grouping_key, registry in pushes:
+                self._push(registry, method, grouping_key)
+            return
+
+        futures = [
+            self._push_executor.submit(self._push, registry, method, grouping_key)
+            for grouping_key, registry in pushes
+        ]
+        for future in futures:
+            future.result()
+
+    def _schedule_push(self, *changed: str) -> None:
+        self._mark_changed(changed)
+        if self._flusher is not None:
+            self._flusher.mark_dirty()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._push_to_gateway()
+            return
+
+        # NOTE: called from a coroutine, the push is offloaded to the loop's default executor
+        # so the event loop is never blocked. Pushes requested while one is in flight are
+        # coalesced into a single follow-up push.
+        with self._push_state_lock:
+            self._push_requested = True
+            if self._push_running:
+                return
+            self._push_running = True
+        loop.run_in_executor(None, self._drain_push_requests)
+
+    def _drain_push_requests(self) -> None:
+        while True:
+            with self._push_state_lock:
+                if not self._push_requested:
+                    self._push_running = False
+                    return
+                self._push_requested = False
+            try:
+                with self._push_lock:
+                    self._push_to_gateway()
+            except Exception as exc:
+                logger.warning(f"Pushgateway push failed: {exc.__class__.__name__}: {exc}")
+
+    def flush(self) -> None:
+        if self._flusher is not None:
+            self._flusher.flush()
+        elif self._push_running:
+            # NOTE: waits for the offloaded push and pushes again, so the gateway has the
+            # latest state when flush returns.
+            with self._push_lock:
+                self._push_to_gateway()
+
+    def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.stop()
+        if self.http_server is not None:
+            self.http_server.close()
+        if self._push_executor is not None:
+            self._push_executor.shutdown()
+        if self._transport is not None:
+            self._transport.close()
+        if self.multiprocess_dir is not None:
+            mark_process_dead(os.getpid(), self.multiprocess_dir)
+
     def _get_registered_metric(
         self, metric_type: str, name: str, label_names: Optional[Tuple[str, ...]] = None
     ) -> PrometheusMetric:
@@ -84,56 +562,225 @@ class PrometheusClient(BaseClient):
             raise MetricNotRegisteredError
         return metric
 
-    def register_metric(
+    def _create_metric(
         self,
         metric_type: str,
         name: str,
         documentation: str,
         label_names: Optional[Tuple[str, ...]] = None,
+        **options: Any,
     ) -> PrometheusMetric:
-        metric = PROMETHEUS_METRIC_CLASS_MAP[metric_type](
+        kwargs: Dict[str, Any] = {}
+        if metric_type == "gauge" and options.get("multiprocess_mode") is not None:
+            kwargs["multiprocess_mode"] = options["multiprocess_mode"]
+        if metric_type == "histogram" and options.get("buckets") is not None:
+            kwargs["buckets"] = options["buckets"]
+
+        metric_class = PROMETHEUS_METRIC_CLASS_MAP[metric_type]
+        if options.get("series_ttl") is not None and metric_type in EXPIRING_METRIC_CLASS_MAP:
+            metric_class = EXPIRING_METRIC_CLASS_MAP[metric_type]
+            kwargs["series_ttl"] = options["series_ttl"]
+            if self.on_series_expired is not None:
+                kwargs["on_expire"] = partial(self.on_series_expired, name)
+            with self._changed_lock:
+                self._expiring_metrics.add(name)
+        # NOTE: in multiprocess mode values must live in the mmap-backed files.
+        if metric_type == "histogram" and options.get("compact_buckets"):
+            if self.multiprocess_dir is None:
+                metric_class = CompactHistogram
+        if metric_type == "summary" and self.multiprocess_dir is None:
+            metric_class = QuantileSummary
+            for option in ("quantiles", "max_age", "age_buckets"):
+                if options.get(option) is not None:
+                    kwargs[option] = options[option]
+        metric = metric_class(
             name=name,
             documentation=documentation,
             labelnames=label_names or (),
             registry=self._registry,
+            **kwargs,
         )
+        self._collector_names[metric] = name
+        return metric
+
+    def register_metric(
+        self,
+        metric_type: str,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        **options: Any,
+    ) -> PrometheusMetric:
+        metric = self._create_metric(metric_type, name, documentation, label_names, **options)
         if self.pushgateway_enabled:
-            self._push_to_gateway()
+            self._schedule_push(name)
 
         return metric
 
+    def register_metrics(self, metrics: List[MetricDefinition]) -> None:
+        # NOTE: all or nothing, collectors created before a failure are unregistered.
+        created: List[PrometheusMetric] = []
+        try:
+            for metric_type, name, documentation, label_names, options in metrics:
+                created.append(
+                    self._create_metric(metric_type, name, documentation, label_names, **options)
+                )
+        except Exception:
+            for metric in created:
+                self._registry.unregister(metric)
+                with self._changed_lock:
+                    self._expiring_metrics.discard(self._collector_names.pop(metric))
+            raise
+        if self.pushgateway_enabled and metrics:
+            self._schedule_push(*(metric[1] for metric in metrics))
+
+    def bind(
+        self,
+        metric_type: str,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: float = 1.0,
+    ) -> Callable[[Any], None]:
+        metric = self._get_registered_metric(metric_type, name)
+        child = metric.labels(**labels) if labels else metric
+        update: Callable[[Any], None] = getattr(child, PROMETHEUS_UPDATE_METHOD_MAP[metric_type])
+        if labels and isinstance(metric, (ExpiringGauge, ExpiringHistogram)):
+            update = self._bind_expiring(metric, labels, PROMETHEUS_UPDATE_METHOD_MAP[metric_type])
+        if metric_type == "counter" and sample_rate < 1:
+            increment = update
+
+            def update(value: Any) -> None:
+                increment(value / sample_rate)
+
+        if not self.pushgateway_enabled:
+            return update
+
+        def update_and_push(value: Any) -> None:
+            update(value)
+            self._schedule_push(name)
+
+        return update_and_push
+
+    def _bind_expiring(
+        self,
+        metric: Union[ExpiringGauge, ExpiringHistogram],
+        labels: Dict[str, Any],
+        method_name: str,
+    ) -> Callable[[Any], None]:
+        # NOTE: the bound child is removed from the metric once it expires, it's then looked
+        # up and created again, instead of updating a child that isn't exported anymore.
+        label_values = tuple(str(labels[label_name]) for label_name in metric._labelnames)
+
+        def update(value: Any) -> None:
+            child: Any = metric._metrics.get(label_values)
+            if child is None:
+                child = metric.labels(*label_values)
+            getattr(child, method_name)(value)
+
+        return update
+
+    def record_many(self, updates: List[MetricUpdate]) -> None:
+        for metric_type, name, labels, value, sample_rate in updates:
+            metric = self._get_registered_metric(metric_type, name)
+            child = metric.labels(**labels) if labels else metric
+            if metric_type == "counter" and sample_rate < 1:
+                value = value / sample_rate
+            getattr(child, PROMETHEUS_UPDATE_METHOD_MAP[metric_type])(value)
+
+        if self.pushgateway_enabled and updates:
+            self._schedule_push(*{update.name for update in updates})
+
+    def set_gauge_callback(
+        self, name: str, labels: Optional[Dict[str, Any]], callback: Callable[[], float]
+    ) -> None:
+        # NOTE: evaluated when the registry is collected. In multiprocess mode the exposed
+        # values are read from the files, so callbacks are ignored.
+        gauge = self._get_registered_metric("gauge", name)
+        child = gauge.labels(**labels) if labels else gauge
+        child.set_function(callback)
+
+    def remove_series(self, metric_type: str, name: str, labels: Dict[str, Any]) -> None:
+        metric = self._get_registered_metric(metric_type, name)
+        try:
+            metric.remove(*(labels[label_name] for label_name in metric._labelnames))
+        except KeyError:
+            return
+        if self.pushgateway_enabled:
+            self._schedule_push(name)
+
+    def series(self, name: str) -> List[Tuple[str, ...]]:
+        try:
+            metric = self._get_registered_metric("", name)
+        except MetricNotRegisteredError:
+            return []
+        if not metric._labelnames:
+            return []
+        with metric._lock:
+            return [tuple(label_values) for label_values in metric._metrics]
+
     def increment_counter(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: int = 1
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: int = 1,
+        sample_rate: float = 1.0,
     ) -> None:
         label_names: Optional[Tuple[str, ...]] = tuple(labels.keys()) if labels else None
         counter = self._get_registered_metric("counter", name, label_names)
-        counter.labels(**labels).inc(value) if labels else counter.inc(value)
+        # NOTE: a sampled counter is incremented by its estimated total. Other types can't
+        # be scaled, sampling only reduces how often they're updated.
+        amount = value / sample_rate if sample_rate < 1 else value
+        counter.labels(**labels).inc(amount) if labels else counter.inc(amount)
 
         if self.pushgateway_enabled:
-            self._push_to_gateway()
+            self._schedule_push(name)
 
         return
 
     def set_gauge_value(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
     ) -> None:
         label_names: Optional[Tuple[str, ...]] = tuple(labels.keys()) if labels else None
         gauge = self._get_registered_metric("gauge", name, label_names)
         gauge.labels(**labels).set(value) if labels else gauge.set(value)
 
         if self.pushgateway_enabled:
-            self._push_to_gateway()
+            self._schedule_push(name)
 
         return
 
     def set_histogram_value(
-        self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 0.0
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
     ) -> None:
         label_names: Optional[Tuple[str, ...]] = tuple(labels.keys()) if labels else None
         histogram = self._get_registered_metric("histogram", name, label_names)
-        histogram.labels(**labels).set(value) if labels else histogram.set(value)
+        histogram.labels(**labels).observe(value) if labels else histogram.observe(value)
 
         if self.pushgateway_enabled:
-            self._push_to_gateway()
+            self._schedule_push(name)
+
+        return
+
+    def set_summary_value(
+        self,
+        name: str,
+        labels: Optional[Dict[str, Any]] = None,
+        value: float = 0.0,
+        sample_rate: float = 1.0,
+    ) -> None:
+        label_names: Optional[Tuple[str, ...]] = tuple(labels.keys()) if labels else None
+        summary = self._get_registered_metric("summary", name, label_names)
+        summary.labels(**labels).observe(value) if labels else summary.observe(value)
+
+        if self.pushgateway_enabled:
+            self._schedule_push(name)
 
         return
@@ -0,0 +1,132 @@
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.exposition import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.openmetrics import exposition as openmetrics
+
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+OPENMETRICS_MEDIA_TYPE = "application/openmetrics-text"
+
+EXPOSITION_FORMATS: Dict[str, Tuple[Callable[[CollectorRegistry], bytes], str]] = {
+    "text": (generate_latest, CONTENT_TYPE_LATEST),
+    "openmetrics": (openmetrics.generate_latest, openmetrics.CONTENT_TYPE_LATEST),
+}
+
+
+class Rendering:
+    def __init__(self, body: bytes, content_type: str) -> None:
+        self.body = body
+        self.content_type = content_type
+        self.rendered_at = time.monotonic()
+        self._gzipped: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def gzipped(self) -> bytes:
+        # NOTE: compressed once, on the first scrape accepting gzip.
+        if self._gzipped is None:
+            with self._lock:
+                if self._gzipped is None:
+                    self._gzipped = gzip.compress(self.body)
+        return self._gzipped
+
+
+class CachedExposition:
+    # NOTE: the registry is rendered at most once per `min_refresh_interval` and format.
+    # Scrapers arriving during a render wait for it and are served the same bytes, instead
+    # of rendering again.
+    def __init__(
+        self, registry: CollectorRegistry, min_refresh_interval: float = DEFAULT_REFRESH_INTERVAL
+    ) -> None:
+        if min_refresh_interval < 0:
+            raise ValueError("min_refresh_interval must not be negative.")
+
+        self.registry = registry
+        self.min_refresh_interval = min_refresh_interval
+        self._renderings: Dict[str, Rendering] = {}
+        self._lock = threading.Lock()
+
+    def _fresh_rendering(self, exposition_format: str, requested_at: float) -> Optional[Rendering]:
+        rendering = self._renderings.get(exposition_format)
+        if rendering is None:
+            return None
+        # NOTE: rendered after the request, while it was waiting for the lock.
+        if rendering.rendered_at >= requested_at:
+            return rendering
+        if requested_at - rendering.rendered_at < self.min_refresh_interval:
+            return rendering
+        return None
+
+    def render(self, exposition_format: str = "text") -> Rendering:
+        requested_at = time.monotonic()
+        rendering = self._fresh_rendering(exposition_format, requested_at)
+        if rendering is not None:
+            return rendering
+
+        with self._lock:
+            rendering = self._fresh_rendering(exposition_format, requested_at)
+            if rendering is None:
+                encoder, content_type = EXPOSITION_FORMATS[exposition_format]
+                rendering = Rendering(encoder(self.registry), content_type)
+                self._renderings[exposition_format] = rendering
+            return rendering
+
+
+def _accepts(header: Optional[str], media_type: str) -> bool:
+    return any(
+        accepted.split(";")[0].strip() == media_type for accepted in (header or "").split(",")
+    )
+
+
+class _ExpositionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "ExpositionServer"
+
+    def do_GET(self) -> None:
+        accept = self.headers.get("Accept")
+        exposition_format = "openmetrics" if _accepts(accept, OPENMETRICS_MEDIA_TYPE) else "text"
+        rendering = self.server.exposition.render(exposition_format)
+        body = rendering.body
+        self.send_response(200)
+        self.send_header("Content-Type", rendering.content_type)
+        self.send_header("Vary", "Accept, Accept-Encoding")
+        if _accepts(self.headers.get("Accept-Encoding"), "gzip"):
+            body = rendering.gzipped()
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        return None
+
+
+class ExpositionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        registry: CollectorRegistry,
+        port: int,
+        addr: str = "0.0.0.0",
+        min_refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+    ) -> None:
+        self.exposition = CachedExposition(registry, min_refresh_interval)
+        super().__init__((addr, port), _ExpositionHandler)
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="snyk-metrics-exposition", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return int(self.server_address[1])
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
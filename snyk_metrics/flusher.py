@@ -0,0 +1,91 @@
+import atexit
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher:
+    # NOTE: calls `flush` from a daemon thread at most once per `interval`. Producers only
+    # mark_dirty(), or request_flush() to wake the thread early. With `max_staleness` it
+    # also flushes when nothing changed for that long. stop() flushes one last time, and
+    # runs at exit.
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[], None],
+        interval: float,
+        max_staleness: Optional[float] = None,
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("flush interval must be greater than 0.")
+        if max_staleness is not None and max_staleness <= 0:
+            raise ValueError("max staleness must be greater than 0.")
+
+        self.name = name
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self._flush = flush
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def request_flush(self) -> None:
+        self._dirty = True
+        self._wakeup.set()
+
+    def _is_stale(self) -> bool:
+        return (
+            self.max_staleness is not None
+            and time.monotonic() - self._last_flush >= self.max_staleness
+        )
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                return
+            if not self._dirty and not self._is_stale():
+                continue
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.warning(f"{self.name} flush failed: {exc.__class__.__name__}: {exc}")
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            # NOTE: cleared before flushing so that updates happening during the flush
+            # are picked up by the next one.
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            try:
+                self._flush()
+            except Exception:
+                self._dirty = True
+                raise
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        atexit.unregister(self.stop)
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        if self._dirty:
+            self.flush()
@@ -1,23 +1,149 @@
+import asyncio
 import logging
-from typing import Any, Dict, Optional, Tuple
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
 
-from snyk_metrics import get_client
+from snyk_metrics import _defer_registration, get_client
 
-from .client import Metric, MetricsClient, MetricTypes
+from .client import Metric, MetricsClient, MetricTypes, _exception_handler, _random
 from .exceptions import ClientNotInitialisedError
 
 logger = logging.getLogger(__name__)
 
 
+class BoundMetric:
+    # NOTE: labels are validated and resolved by every backend once, when the handle is
+    # created, updates then go straight to the pre-resolved backend emitters.
+    def __init__(self, client: MetricsClient, metric: Metric, labels: Dict[str, Any]) -> None:
+        self.metric = metric
+        self.labels = labels
+        self._raise_exceptions = client._raise_exceptions
+        self._suppress = client._suppress
+        self._sample_rate = metric.sample_rate
+        self._emitters = client.bind_metric(metric, labels) or ()
+
+
+class BoundCounter(BoundMetric):
+    @_exception_handler
+    def increment(self, value: int = 1) -> None:
+        if self._sample_rate < 1 and _random() >= self._sample_rate:
+            return
+        for emit in self._emitters:
+            emit(value)
+
+
+class BoundGauge(BoundMetric):
+    @_exception_handler
+    def set_value(self, value: float = 0.0) -> None:
+        if self._sample_rate < 1 and _random() >= self._sample_rate:
+            return
+        for emit in self._emitters:
+            emit(value)
+
+
+class BoundHistogram(BoundMetric):
+    @_exception_handler
+    def observe(self, value: float) -> None:
+        if self._sample_rate < 1 and _random() >= self._sample_rate:
+            return
+        for emit in self._emitters:
+            emit(value)
+
+    def set_value(self, value: float = 0.0) -> None:
+        self.observe(value)
+
+
+class BoundSummary(BoundMetric):
+    @_exception_handler
+    def observe(self, value: float) -> None:
+        if self._sample_rate < 1 and _random() >= self._sample_rate:
+            return
+        for emit in self._emitters:
+            emit(value)
+
+
+class Timer:
+    # NOTE: times a `with` block, or every call of the decorated function, with the
+    # monotonic perf_counter_ns, and observes the duration in seconds. With a sample rate
+    # below 1 only that fraction of blocks or calls is timed and observed.
+    def __init__(
+        self,
+        metric: Union["Histogram", "Summary"],
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.metric = metric
+        self.sample_rate = metric.sample_rate if sample_rate is None else sample_rate
+        self._labels = labels
+        self._start: Optional[int] = None
+
+    def set_labels(self, **labels: Any) -> None:
+        # NOTE: labels only known at the end of the block, e.g. the response status.
+        self._labels = {**self._labels, **labels} if self._labels else labels
+
+    def __enter__(self) -> "Timer":
+        if self.sample_rate >= 1 or _random() < self.sample_rate:
+            self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._start is None:
+            return
+        duration = (time.perf_counter_ns() - self._start) / 1e9
+        self._start = None
+        self.metric._observe_sampled(duration, self._labels, self.sample_rate)
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        # NOTE: inlined rather than a Timer per call, decorated functions are often hot.
+        metric, labels, sample_rate = self.metric, self._labels, self.sample_rate
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_inner_func(*args: Any, **kwargs: Any) -> Any:
+                if sample_rate < 1 and _random() >= sample_rate:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    duration = (time.perf_counter_ns() - start) / 1e9
+                    metric._observe_sampled(duration, labels, sample_rate)
+
+            return async_inner_func
+
+        @wraps(func)
+        def inner_func(*args: Any, **kwargs: Any) -> Any:
+            if sample_rate < 1 and _random() >= sample_rate:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = (time.perf_counter_ns() - start) / 1e9
+                metric._observe_sampled(duration, labels, sample_rate)
+
+        return inner_func
+
+
 class Counter(Metric):
     def __init__(
-        self, name: str, documentation: str, label_names: Optional[Tuple[str, ...]] = None
+        self,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        max_series: Optional[int] = None,
+        evict_series: bool = False,
+        sample_rate: float = 1.0,
     ):
         super().__init__(
             metric_type=MetricTypes.COUNTER,
             name=name,
             documentation=documentation,
             label_names=label_names,
+            max_series=max_series,
+            evict_series=evict_series,
+            sample_rate=sample_rate,
         )
 
         self._client: Optional[MetricsClient] = None
@@ -26,24 +152,48 @@ class Counter(Metric):
             self._client = get_client()
             self._client.register_metric(self)
         except ClientNotInitialisedError:
-            pass
+            _defer_registration(self)
 
-    def increment(self, value: int = 1, labels: Optional[Dict[str, Any]] = None) -> None:
+    def labels(self, **labels: Any) -> BoundCounter:
         if not self._client:
             self._client = get_client()
 
-        self._client.increment_counter(self, value=value, labels=labels)
+        return BoundCounter(self._client, self, labels)
+
+    def increment(
+        self,
+        value: int = 1,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        if not self._client:
+            self._client = get_client()
+
+        self._client.increment_counter(self, value=value, labels=labels, sample_rate=sample_rate)
 
 
 class Gauge(Metric):
     def __init__(
-        self, name: str, documentation: str, label_names: Optional[Tuple[str, ...]] = None
+        self,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        multiprocess_mode: Optional[str] = None,
+        max_series: Optional[int] = None,
+        evict_series: bool = False,
+        sample_rate: float = 1.0,
+        series_ttl: Optional[float] = None,
     ):
         super().__init__(
             metric_type=MetricTypes.GAUGE,
             name=name,
             documentation=documentation,
             label_names=label_names,
+            multiprocess_mode=multiprocess_mode,
+            max_series=max_series,
+            evict_series=evict_series,
+            sample_rate=sample_rate,
+            series_ttl=series_ttl,
         )
 
         self._client: Optional[MetricsClient] = None
@@ -52,24 +202,58 @@ class Gauge(Metric):
             self._client = get_client()
             self._client.register_metric(self)
         except ClientNotInitialisedError:
-            pass
+            _defer_registration(self)
+
+    def labels(self, **labels: Any) -> BoundGauge:
+        if not self._client:
+            self._client = get_client()
+
+        return BoundGauge(self._client, self, labels)
 
-    def set_value(self, value: float = 0.0, labels: Optional[Dict[str, Any]] = None) -> None:
+    def set_value(
+        self,
+        value: float = 0.0,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
         if not self._client:
             self._client = get_client()
 
-        self._client.set_gauge_value(self, value=value, labels=labels)
+        self._client.set_gauge_value(self, value=value, labels=labels, sample_rate=sample_rate)
+
+    def set_callback(
+        self, callback: Callable[[], float], labels: Optional[Dict[str, Any]] = None
+    ) -> None:
+        if not self._client:
+            self._client = get_client()
+
+        self._client.set_gauge_callback(self, callback, labels=labels)
 
 
 class Histogram(Metric):
     def __init__(
-        self, name: str, documentation: str, label_names: Optional[Tuple[str, ...]] = None
+        self,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        max_series: Optional[int] = None,
+        evict_series: bool = False,
+        sample_rate: float = 1.0,
+        series_ttl: Optional[float] = None,
+        buckets: Optional[Sequence[float]] = None,
+        compact_buckets: bool = False,
     ):
         super().__init__(
             metric_type=MetricTypes.HISTOGRAM,
             name=name,
             documentation=documentation,
             label_names=label_names,
+            max_series=max_series,
+            evict_series=evict_series,
+            sample_rate=sample_rate,
+            series_ttl=series_ttl,
+            buckets=tuple(buckets) if buckets is not None else None,
+            compact_buckets=compact_buckets,
         )
 
         self._client: Optional[MetricsClient] = None
@@ -78,10 +262,107 @@ class Histogram(Metric):
             self._client = get_client()
             self._client.register_metric(self)
         except ClientNotInitialisedError:
-            pass
+            _defer_registration(self)
+
+    def labels(self, **labels: Any) -> BoundHistogram:
+        if not self._client:
+            self._client = get_client()
+
+        return BoundHistogram(self._client, self, labels)
+
+    def time(
+        self, labels: Optional[Dict[str, Any]] = None, sample_rate: Optional[float] = None
+    ) -> Timer:
+        return Timer(self, labels=labels, sample_rate=sample_rate)
+
+    def observe(
+        self,
+        value: float,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        if not self._client:
+            self._client = get_client()
+
+        self._client.set_histogram_value(self, value=value, labels=labels, sample_rate=sample_rate)
+
+    def _observe_sampled(
+        self, value: float, labels: Optional[Dict[str, Any]], sample_rate: float
+    ) -> None:
+        if not self._client:
+            self._client = get_client()
+
+        self._client._observe_sampled(self, value, labels, sample_rate)
+
+    def set_value(
+        self,
+        value: float = 0.0,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        self.observe(value, labels=labels, sample_rate=sample_rate)
+
+
+class Summary(Metric):
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Optional[Tuple[str, ...]] = None,
+        max_series: Optional[int] = None,
+        evict_series: bool = False,
+        sample_rate: float = 1.0,
+        quantiles: Optional[Sequence[float]] = None,
+        max_age: Optional[float] = None,
+        age_buckets: Optional[int] = None,
+    ):
+        super().__init__(
+            metric_type=MetricTypes.SUMMARY,
+            name=name,
+            documentation=documentation,
+            label_names=label_names,
+            max_series=max_series,
+            evict_series=evict_series,
+            sample_rate=sample_rate,
+            quantiles=tuple(quantiles) if quantiles is not None else None,
+            max_age=max_age,
+            age_buckets=age_buckets,
+        )
+
+        self._client: Optional[MetricsClient] = None
+
+        try:
+            self._client = get_client()
+            self._client.register_metric(self)
+        except ClientNotInitialisedError:
+            _defer_registration(self)
+
+    def labels(self, **labels: Any) -> BoundSummary:
+        if not self._client:
+            self._client = get_client()
+
+        return BoundSummary(self._client, self, labels)
+
+    def time(
+        self, labels: Optional[Dict[str, Any]] = None, sample_rate: Optional[float] = None
+    ) -> Timer:
+        return Timer(self, labels=labels, sample_rate=sample_rate)
+
+    def observe(
+        self,
+        value: float,
+        labels: Optional[Dict[str, Any]] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        if not self._client:
+            self._client = get_client()
+
+        self._client.set_summary_value(self, value=value, labels=labels, sample_rate=sample_rate)
 
-    def set_value(self, value: float = 0.0, labels: Optional[Dict[str, Any]] = None) -> None:
+    def _observe_sampled(
+        self, value: float, labels: Optional[Dict[str, Any]], sample_rate: float
+    ) -> None:
         if not self._client:
             self._client = get_client()
 
-        self._client.set_histogram_value(self, value=value, labels=labels)
+        self._client._observe_sampled(self, value, labels, sample_rate)
@@ -0,0 +1,30 @@
+import os
+from typing import Optional
+
+from prometheus_client import CollectorRegistry, multiprocess, values
+
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def enable_multiprocess_mode(path: str) -> None:
+    # NOTE: values of the metrics created from now on are stored in mmap-backed files in
+    # `path`, one per process. It must be enabled before any metric is created.
+    os.makedirs(path, exist_ok=True)
+    os.environ[MULTIPROCESS_DIR_ENV] = path
+    values.ValueClass = values.MultiProcessValue()  # type: ignore[no-untyped-call]
+
+
+def exposition_registry(path: Optional[str] = None) -> CollectorRegistry:
+    # NOTE: a registry merging the values written by every process, to be used for
+    # exposition only: the processes' own metrics must not be registered in it.
+    registry = CollectorRegistry()
+    path = path or os.environ.get(MULTIPROCESS_DIR_ENV)
+    multiprocess.MultiProcessCollector(registry, path=path)  # type: ignore[no-untyped-call]
+    return registry
+
+
+def mark_process_dead(pid: int, path: Optional[str] = None) -> None:
+    # NOTE: to be called when a worker exits, e.g. from gunicorn's `child_exit` hook, so the
+    # live gauges of the dead process are removed.
+    path = path or os.environ.get(MULTIPROCESS_DIR_ENV)
+    multiprocess.mark_process_dead(pid, path)  # type: ignore[no-untyped-call]
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from prometheus_client.metrics_core import CounterMetricFamily
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPORT_INTERVAL = 60.0
+
+ErrorKey = Tuple[str, str]
+
+
+class ErrorReporter:
+    # NOTE: suppressed exceptions are counted per metric and exception type, a summary is
+    # logged at most once per `interval`, without stack traces. The first exception is
+    # logged right away, a timer logs the exceptions pending once the interval is over.
+    # Also a collector, exposing the counts to Prometheus. Without `summarise` exceptions
+    # are only counted, the caller logs them.
+    def __init__(self, interval: float = DEFAULT_REPORT_INTERVAL, summarise: bool = True) -> None:
+        if interval <= 0:
+            raise ValueError("report interval must be greater than 0.")
+
+        self.interval = interval
+        self.summarise = summarise
+        self.counts: Dict[ErrorKey, int] = {}
+        self._pending: Dict[ErrorKey, Tuple[int, str]] = {}
+        self._next_report = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def report(self, metric_name: str, exc: Exception) -> None:
+        key = (metric_name, exc.__class__.__name__)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if not self.summarise:
+                return
+            # NOTE: the message is only formatted for the first exception of a summary.
+            entry = self._pending.get(key)
+            self._pending[key] = (1, str(exc)) if entry is None else (entry[0] + 1, entry[1])
+            now = time.monotonic()
+            if now < self._next_report:
+                if self._timer is None:
+                    self._timer = threading.Timer(self._next_report - now, self._report_pending)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._next_report = now + self.interval
+            pending = self._take_pending()
+        _log_summary(pending)
+
+    def flush(self) -> None:
+        with self._lock:
+            pending = self._take_pending()
+        if pending:
+            _log_summary(pending)
+
+    def _report_pending(self) -> None:
+        with self._lock:
+            self._timer = None
+            if not self._pending:
+                return
+            self._next_report = time.monotonic() + self.interval
+            pending = self._take_pending()
+        _log_summary(pending)
+
+    def _take_pending(self) -> Dict[ErrorKey, Tuple[int, str]]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def describe(self) -> Iterable[CounterMetricFamily]:
+        return [self._family()]
+
+    def collect(self) -> Iterable[CounterMetricFamily]:
+        family = self._family()
+        with self._lock:
+            counts = list(self.counts.items())
+        for (metric_name, exception), count in counts:
+            family.add_metric([metric_name, exception], count)
+        return [family]
+
+    def _family(self) -> CounterMetricFamily:
+        return CounterMetricFamily(
+            "snyk_metrics_suppressed_exceptions",
+            "Exceptions suppressed by the metrics client.",
+            labels=("metric", "exception"),
+        )
+
+
+def _log_summary(pending: Dict[ErrorKey, Tuple[int, str]]) -> None:
+    errors = ", ".join(
+        f"{metric_name or '-'} {exception} x{count} ({message})"
+        for (metric_name, exception), (count, message) in pending.items()
+    )
+    logger.warning(
+        f"Suppressed {sum(count for count, _ in pending.values())} exceptions: {errors}"
+    )
@@ -0,0 +1,162 @@
+import math
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+DEFAULT_COMPRESSION = 100.0
+DEFAULT_MAX_AGE = 600.0
+DEFAULT_AGE_BUCKETS = 5
+
+
+class TDigest:
+    # NOTE: a merging t-digest. Values are buffered and merged into centroids, whose size
+    # is bounded by the k1 scale function: small near the tails, large around the median.
+    # The number of centroids stays under ~`compression`, whatever the number of values.
+    def __init__(self, compression: float = DEFAULT_COMPRESSION) -> None:
+        self.compression = compression
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._means: List[float] = []
+        self._weights: List[float] = []
+        self._buffer: List[Tuple[float, float]] = []
+        self._buffer_limit = int(compression) * 5
+
+    def __len__(self) -> int:
+        self._compress()
+        return len(self._means)
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        self._buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self._buffer_limit:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        other._compress()
+        self._buffer.extend(zip(other._means, other._weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def centroids(self) -> Iterable[Tuple[float, float]]:
+        self._compress()
+        return zip(self._means, self._weights)
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+
+        points = sorted([*zip(self._means, self._weights), *self._buffer])
+        self._buffer = []
+        means: List[float] = []
+        weights: List[float] = []
+        cumulative = 0.0
+        q_limit = self._q(self._k(0.0) + 1)
+        mean, weight = points[0]
+        for point_mean, point_weight in points[1:]:
+            if (cumulative + weight + point_weight) / self.count <= q_limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+                continue
+
+            means.append(mean)
+            weights.append(weight)
+            cumulative += weight
+            q_limit = self._q(self._k(cumulative / self.count) + 1)
+            mean, weight = point_mean, point_weight
+        means.append(mean)
+        weights.append(weight)
+        self._means, self._weights = means, weights
+
+    def quantile(self, q: float) -> float:
+        self._compress()
+        if not self._means:
+            return math.nan
+        if len(self._means) == 1:
+            return self._means[0]
+
+        # NOTE: centroids are treated as points at the centre of their weight, values are
+        # interpolated between them and between the outer ones and the min and max.
+        target = q * self.count
+        previous_mean, previous_center = self.min, 0.0
+        cumulative = 0.0
+        for mean, weight in zip(self._means, self._weights):
+            center = cumulative + weight / 2
+            if target < center:
+                return _interpolate(target, previous_center, center, previous_mean, mean)
+            previous_mean, previous_center = mean, center
+            cumulative += weight
+        return _interpolate(target, previous_center, self.count, previous_mean, self.max)
+
+
+def _interpolate(x: float, x0: float, x1: float, y0: float, y1: float) -> float:
+    if x1 <= x0:
+        return y1
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+class SlidingQuantiles:
+    # NOTE: values are added to the digest of the current age bucket only, quantiles are
+    # computed over the merge of all the buckets, so the window covers between
+    # max_age * (age_buckets - 1) / age_buckets and max_age seconds.
+    def __init__(
+        self,
+        quantiles: Tuple[float, ...] = DEFAULT_QUANTILES,
+        max_age: float = DEFAULT_MAX_AGE,
+        age_buckets: int = DEFAULT_AGE_BUCKETS,
+        compression: float = DEFAULT_COMPRESSION,
+    ) -> None:
+        if any(not 0 <= quantile <= 1 for quantile in quantiles):
+            raise ValueError("quantiles must be between 0 and 1.")
+        if age_buckets < 1:
+            raise ValueError("age_buckets must be greater than 0.")
+
+        self.quantiles = quantiles
+        self.compression = compression
+        self._bucket_width = max_age / age_buckets
+        self._digests = [TDigest(compression) for _ in range(age_buckets)]
+        self._current = 0
+        self._next_rotation = time.monotonic() + self._bucket_width
+        self._lock = threading.Lock()
+
+    def _rotate(self, now: float) -> None:
+        for _ in range(len(self._digests)):
+            if now < self._next_rotation:
+                return
+            self._current = (self._current + 1) % len(self._digests)
+            self._digests[self._current] = TDigest(self.compression)
+            self._next_rotation += self._bucket_width
+        # NOTE: idle for longer than the window, every bucket has been reset.
+        if now >= self._next_rotation:
+            self._next_rotation = now + self._bucket_width
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now >= self._next_rotation:
+                self._rotate(now)
+            self._digests[self._current].add(value)
+
+    def values(self, now: Optional[float] = None) -> List[Tuple[float, float]]:
+        now = time.monotonic() if now is None else now
+        digest = TDigest(self.compression)
+        with self._lock:
+            if now >= self._next_rotation:
+                self._rotate(now)
+            for bucket_digest in self._digests:
+                if bucket_digest.count:
+                    digest.merge(bucket_digest)
+        return [(quantile, digest.quantile(quantile)) for quantile in self.quantiles]
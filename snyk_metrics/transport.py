@@ -0,0 +1,150 @@
+import base64
+import gzip
+import http.client
+import threading
+from queue import Empty, Full, LifoQueue
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import quote_plus
+
+from prometheus_client import CollectorRegistry
+from prometheus_client.exposition import (
+    CONTENT_TYPE_LATEST,
+    basic_auth_handler,
+    default_handler,
+    generate_latest,
+)
+
+DEFAULT_PUSH_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 2
+
+# NOTE: errors of a kept-alive connection closed by the server since its last use.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+def _escape_grouping_key(name: str, value: str) -> str:
+    # NOTE: same encoding as prometheus_client's push_to_gateway.
+    if "/" in value:
+        return f"{name}@base64/{base64.urlsafe_b64encode(value.encode('utf-8')).decode('utf-8')}"
+    if not value:
+        return f"{name}@base64/="
+    return f"{name}/{quote_plus(value)}"
+
+
+def _basic_auth_header(username: Optional[str], password: Optional[str]) -> str:
+    credentials = f"{username or ''}:{password or ''}".encode("utf-8")
+    return f"Basic {base64.b64encode(credentials).decode('utf-8')}"
+
+
+def push_handler(
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    gzip_enabled: bool = False,
+    payload: Optional[threading.local] = None,
+) -> Callable[..., Callable[[], None]]:
+    # NOTE: a handler for prometheus_client's push_to_gateway, built once per client. The
+    # size of the pushed payload is stored in `payload.size`, for the pushing thread.
+    authenticated = bool(username or password)
+
+    def handler(
+        url: str, method: str, timeout: Optional[float], headers: Any, data: bytes
+    ) -> Callable[[], None]:
+        if gzip_enabled:
+            data, headers = gzip.compress(data), [*headers, ("Content-Encoding", "gzip")]
+        if payload is not None:
+            payload.size = len(data)
+        if authenticated:
+            return basic_auth_handler(url, method, timeout, headers, data, username, password)
+        return default_handler(url, method, timeout, headers, data)
+
+    return handler
+
+
+class PushgatewayTransport:
+    # NOTE: pushes over kept-alive HTTP/1.1 connections instead of a new urllib connection
+    # per push. Idle connections are pooled, up to `pool_size`, for concurrent pushes. Like
+    # push_to_gateway the host may start with an http:// or https:// scheme.
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        job_name: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        timeout: float = DEFAULT_PUSH_TIMEOUT,
+        gzip_enabled: bool = False,
+        pool_size: int = DEFAULT_POOL_SIZE,
+    ) -> None:
+        scheme, _, address = host.rpartition("://")
+        if scheme not in ("", "http", "https"):
+            raise ValueError(f"unsupported pushgateway scheme: {scheme}")
+        self.host = address
+        self.port = port
+        self._connection_class = (
+            http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        )
+        self.timeout = timeout
+        self.gzip_enabled = gzip_enabled
+        self.path = f"/metrics/{_escape_grouping_key('job', job_name)}"
+        self._headers: Dict[str, str] = {"Content-Type": CONTENT_TYPE_LATEST}
+        if username or password:
+            self._headers["Authorization"] = _basic_auth_header(username, password)
+        if gzip_enabled:
+            self._headers["Content-Encoding"] = "gzip"
+        self._pool: "LifoQueue[http.client.HTTPConnection]" = LifoQueue(maxsize=pool_size)
+
+    def _acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._pool.get_nowait(), True
+        except Empty:
+            return self._connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(connection)
+        except Full:
+            connection.close()
+
+    def _request(
+        self, connection: http.client.HTTPConnection, method: str, path: str, body: bytes
+    ) -> None:
+        connection.request(method, path, body=body, headers=self._headers)
+        response = connection.getresponse()
+        # NOTE: the response must be read entirely before the connection can be reused.
+        response.read()
+        if response.status >= 400:
+            raise OSError(f"error talking to pushgateway: {response.status} {response.reason}")
+
+    def push(
+        self,
+        registry: CollectorRegistry,
+        method: str = "PUT",
+        grouping_key: Optional[Dict[str, str]] = None,
+    ) -> int:
+        path = self.path
+        for name, value in sorted((grouping_key or {}).items()):
+            path += f"/{_escape_grouping_key(name, str(value))}"
+        body = generate_latest(registry)
+        if self.gzip_enabled:
+            body = gzip.compress(body)
+
+        connection, reused = self._acquire()
+        try:
+            try:
+                self._request(connection, method, path, body)
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                connection.close()
+                self._request(connection, method, path, body)
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection)
+        return len(body)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                return
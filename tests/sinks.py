@@ -0,0 +1,134 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+
+class _PushgatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_PushgatewayServer"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _handle_push(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.pushes += 1
+            self.server.bytes_received += length
+            self.server.last_push = (dict(self.headers), body)
+            self.server.requests.append((self.command, self.path))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_PUT = _handle_push
+    do_POST = _handle_push
+
+    def log_message(self, format: str, *args: object) -> None:
+        return None
+
+
+class _PushgatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    pushes = 0
+    connections = 0
+    bytes_received = 0
+    last_push: Tuple[Dict[str, str], bytes] = ({}, b"")
+    lock = threading.Lock()
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.requests: List[Tuple[str, str]] = []
+
+
+class PushgatewayStandIn:
+    # NOTE: records what the client pushes, for the tests. Also used by the benchmarks, so
+    # they measure the client side only.
+    def __init__(self) -> None:
+        self._server = _PushgatewayServer(("127.0.0.1", 0), _PushgatewayHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return str(self._server.server_address[0])
+
+    @property
+    def port(self) -> int:
+        return int(self._server.server_address[1])
+
+    @property
+    def pushes(self) -> int:
+        return self._server.pushes
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def last_push(self) -> Tuple[Dict[str, str], bytes]:
+        return self._server.last_push
+
+    @property
+    def requests(self) -> List[Tuple[str, str]]:
+        return self._server.requests
+
+    def __enter__(self) -> "PushgatewayStandIn":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class UdpSink:
+    # NOTE: a local Dogstatsd agent stand-in, counts and discards the received datagrams.
+    def __init__(self) -> None:
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.settimeout(0.1)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.datagrams = 0
+        self.bytes_received = 0
+
+    @property
+    def host(self) -> str:
+        return str(self._socket.getsockname()[0])
+
+    @property
+    def port(self) -> int:
+        return int(self._socket.getsockname()[1])
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                datagram = self._socket.recv(65535)
+            except socket.timeout:
+                continue
+            self.datagrams += 1
+            self.bytes_received += len(datagram)
+
+    def __enter__(self) -> "UdpSink":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._stopping.set()
+        self._thread.join()
+        self._socket.close()
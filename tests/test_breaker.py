@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+import pytest
+
+from snyk_metrics.breaker import CircuitBreaker, CircuitStates
+
+
+def _failing_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, backoff=1.0, max_backoff=3.0)
+    for _ in range(2):
+        breaker.record_failure(OSError("unreachable"))
+    return breaker
+
+
+def test_circuit_opens_after_consecutive_failures() -> None:
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure(OSError("unreachable"))
+    assert breaker.allow()
+    breaker.record_failure(OSError("unreachable"))
+
+    assert breaker.state is CircuitStates.OPEN
+    assert not breaker.allow()
+    assert breaker.rejected_calls == 1
+
+
+def test_success_resets_the_failure_count() -> None:
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure(OSError("unreachable"))
+    breaker.record_success()
+    breaker.record_failure(OSError("unreachable"))
+
+    assert breaker.state is CircuitStates.CLOSED
+
+
+def test_a_single_probe_is_allowed_once_the_backoff_elapsed() -> None:
+    with patch("snyk_metrics.breaker.time.monotonic", return_value=0.0) as monotonic:
+        breaker = _failing_breaker()
+        monotonic.return_value = 1.0
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+
+    assert breaker.state is CircuitStates.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_the_backoff_up_to_the_maximum() -> None:
+    with patch("snyk_metrics.breaker.time.monotonic", return_value=0.0) as monotonic:
+        breaker = _failing_breaker()
+        for now, backoff in ((1.0, 2.0), (3.0, 3.0), (6.0, 3.0)):
+            monotonic.return_value = now
+            assert breaker.allow()
+            breaker.record_failure(OSError("unreachable"))
+            monotonic.return_value = now + backoff - 0.1
+            assert not breaker.allow()
+
+    assert breaker.state is CircuitStates.OPEN
+
+
+def test_transitions_are_logged_once() -> None:
+    with patch("snyk_metrics.breaker.logger") as logger:
+        breaker = _failing_breaker()
+        for _ in range(10):
+            breaker.allow()
+            breaker.record_failure(OSError("unreachable"))
+
+    logger.warning.assert_called_once()
+
+
+def test_failure_threshold_must_be_positive() -> None:
+    with pytest.raises(ValueError) as exc:
+        CircuitBreaker("test", failure_threshold=0)
+    assert str(exc.value) == "failure_threshold must be greater than 0."
@@ -0,0 +1,23 @@
+import pytest
+
+from snyk_metrics.buckets import exponential_buckets, linear_buckets
+
+
+def test_exponential_buckets() -> None:
+    assert exponential_buckets(0.001, 10, 4) == pytest.approx((0.001, 0.01, 0.1, 1.0))
+
+
+def test_linear_buckets() -> None:
+    assert linear_buckets(10, 5, 3) == (10, 15, 20)
+
+
+def test_exponential_buckets_factor_must_be_greater_than_one() -> None:
+    with pytest.raises(ValueError) as exc:
+        exponential_buckets(1, 1, 3)
+    assert str(exc.value) == "factor must be greater than 1."
+
+
+def test_linear_buckets_count_must_be_positive() -> None:
+    with pytest.raises(ValueError) as exc:
+        linear_buckets(0, 1, 0)
+    assert str(exc.value) == "count must be greater than 0."
@@ -1,10 +1,31 @@
+import asyncio
+import gzip
+import math
+import os
+import time
+from http.client import HTTPSConnection
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+from threading import Event, current_thread, main_thread
+from typing import Any, List
 from unittest import TestCase
 from unittest.mock import patch
+from urllib.request import Request, urlopen
 
 import pytest
-from prometheus_client import CollectorRegistry
+from datadog import statsd
+from prometheus_client import CollectorRegistry, Counter, push_to_gateway, values
 
-from snyk_metrics.client import Metric, MetricsClient, MetricTypes, Singleton
+from snyk_metrics.buckets import exponential_buckets
+from snyk_metrics.client import (
+    VALIDATION_SAMPLE_INTERVAL,
+    Metric,
+    MetricEvent,
+    MetricsClient,
+    MetricTypes,
+    Singleton,
+)
+from snyk_metrics.clients.prometheus import PrometheusClient
 from snyk_metrics.exceptions import (
     MetricAlreadyRegisteredError,
     MetricLabelMismatchError,
@@ -12,6 +33,10 @@ from snyk_metrics.exceptions import (
     MetricTypeMismatchError,
     RegistryLockedError,
 )
+from snyk_metrics.multiprocess import mark_process_dead
+from snyk_metrics.transport import PushgatewayTransport
+
+from .sinks import PushgatewayStandIn
 
 
 class TestMetricsClient(TestCase):
@@ -318,13 +343,13 @@ class TestMetricsClient(TestCase):
         assert "handler" in kwargs
 
     def test_dogstatsd_client_is_initialised_correctly(self) -> None:
-        with patch("snyk_metrics.clients.dogstatsd.initialize") as initialize:
+        with patch("snyk_metrics.clients.dogstatsd.DogStatsd") as dogstatsd:
             MetricsClient(
                 dogstatsd_enabled=True,
                 dogstatsd_agent_host="localhost",
                 dogstatsd_port=1234,
             )
-        initialize.assert_called_once_with(statsd_host="localhost", statsd_port=1234)
+        dogstatsd.assert_called_once_with(host="localhost", port=1234, socket_path=None)
 
     def test_counter_is_incremented_in_dogstatsd(self) -> None:
         client = MetricsClient(dogstatsd_enabled=True)
@@ -335,7 +360,7 @@ class TestMetricsClient(TestCase):
             label_names=None,
         )
         client.register_metric(metric)
-        with patch("snyk_metrics.clients.dogstatsd.statsd") as statsd:
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
             client.increment_counter(metric)
 
         statsd.increment.assert_called_once_with(metric="test_metric", tags=None, value=1)
@@ -349,7 +374,7 @@ class TestMetricsClient(TestCase):
             label_names=("foo",),
         )
         client.register_metric(metric)
-        with patch("snyk_metrics.clients.dogstatsd.statsd") as statsd:
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
             client.increment_counter(metric, labels={"foo": "bar"})
 
         statsd.increment.assert_called_once_with(metric="test_metric", tags=["foo:bar"], value=1)
@@ -464,7 +489,7 @@ class TestMetricsClient(TestCase):
             label_names=None,
         )
         client.register_metric(metric)
-        with patch("snyk_metrics.clients.dogstatsd.statsd") as statsd:
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
             client.set_gauge_value(metric, value=4.0)
 
         statsd.gauge.assert_called_once_with(metric="test_metric", tags=None, value=4.0)
@@ -485,3 +510,1473 @@ class TestMetricsClient(TestCase):
         labels = {"label_b": "luca", "label_a": "mike"}
         client.increment_counter(metric, labels=labels)
         assert prometheus_registry.get_sample_value("test_metric_total", labels=labels) == 1
+
+    def test_pushgateway_updates_are_deferred_with_flush_interval(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            pushgateway_job_name="pytest",
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            pushgateway_flush_interval=3600,
+            prometheus_registry=prometheus_registry,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push_to_gateway:
+            client.register_metric(metric)
+            for _ in range(10):
+                client.increment_counter(metric)
+            push_to_gateway.assert_not_called()
+
+            client.flush()
+            push_to_gateway.assert_called_once_with(
+                "localhost:9091", "pytest", prometheus_registry
+            )
+
+            # NOTE: nothing changed since the last flush, close has nothing to push.
+            client.close()
+            push_to_gateway.assert_called_once()
+
+    def test_pushgateway_background_flusher_coalesces_updates(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            pushgateway_job_name="pytest",
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            pushgateway_flush_interval=0.05,
+            prometheus_registry=prometheus_registry,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        pushed = Event()
+        with patch(
+            "snyk_metrics.clients.prometheus.push_to_gateway",
+            side_effect=lambda *args, **kwargs: pushed.set(),
+        ) as push_to_gateway:
+            client.register_metric(metric)
+            for _ in range(100):
+                client.increment_counter(metric)
+            assert pushed.wait(timeout=5)
+            client.close()
+
+        assert 1 <= push_to_gateway.call_count < 100
+
+    def test_pushgateway_final_flush_on_close(self) -> None:
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            pushgateway_flush_interval=3600,
+            prometheus_registry=CollectorRegistry(),
+        )
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push_to_gateway:
+            client.register_metric(metric)
+            client.set_gauge_value(metric, value=3.0)
+            client.close()
+
+        push_to_gateway.assert_called_once()
+
+    def test_validated_label_shapes_are_memoised(self) -> None:
+        client = MetricsClient()
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("label_a", "label_b"),
+        )
+        client.register_metric(metric)
+        client.increment_counter(metric, labels={"label_b": "luca", "label_a": "mike"})
+        client.increment_counter(metric, labels={"label_b": "luca", "label_a": "mike"})
+        assert client._schemas["test_metric"].label_shapes == {("label_b", "label_a")}
+
+        with pytest.raises(MetricLabelMismatchError):
+            client.increment_counter(metric, labels={"label_a": "mike"})
+        assert client._schemas["test_metric"].label_shapes == {("label_b", "label_a")}
+
+    def test_validation_can_be_disabled(self) -> None:
+        client = MetricsClient(validation="off")
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        assert client.increment_counter(metric) is None
+
+    def test_sampled_validation_only_checks_some_updates(self) -> None:
+        client = MetricsClient(validation="sampled")
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        for _ in range(VALIDATION_SAMPLE_INTERVAL - 1):
+            client.increment_counter(metric)
+        with pytest.raises(MetricLabelMismatchError):
+            client.increment_counter(metric)
+
+    def test_dogstatsd_aggregates_are_sent_on_close(self) -> None:
+        client = MetricsClient(
+            dogstatsd_enabled=True,
+            dogstatsd_aggregation_enabled=True,
+            dogstatsd_flush_interval=3600,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_counter",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            for _ in range(5):
+                client.increment_counter(metric)
+            client.close()
+
+        statsd.get_socket.return_value.send.assert_called_once_with(b"test_counter:5|c")
+
+    def test_dogstatsd_aggregates_carry_the_constant_tags(self) -> None:
+        with patch.dict(os.environ, {"DD_ENV": "prod", "DD_SERVICE": "api"}):
+            client = MetricsClient(
+                dogstatsd_enabled=True,
+                dogstatsd_aggregation_enabled=True,
+                dogstatsd_flush_interval=3600,
+            )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_counter",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            client.increment_counter(metric, labels={"foo": "bar"})
+            client.close()
+
+        statsd.get_socket.return_value.send.assert_called_once_with(
+            b"test_counter:1|c|#foo:bar,env:prod,service:api"
+        )
+
+    def test_unknown_validation_mode_raises(self) -> None:
+        with pytest.raises(ValueError):
+            MetricsClient(validation="sometimes")
+
+    def test_dogstatsd_aggregation_sums_counters_and_keeps_last_gauge(self) -> None:
+        client = MetricsClient(
+            dogstatsd_enabled=True,
+            dogstatsd_aggregation_enabled=True,
+            dogstatsd_flush_interval=3600,
+        )
+        counter = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_counter",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        gauge = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_gauge",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(counter)
+        client.register_metric(gauge)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            for _ in range(5):
+                client.increment_counter(counter, labels={"foo": "bar"})
+            client.increment_counter(counter, labels={"foo": "baz"}, value=2)
+            client.set_gauge_value(gauge, value=1.0)
+            client.set_gauge_value(gauge, value=4.0)
+            statsd.increment.assert_not_called()
+            client.flush()
+
+        statsd.get_socket.return_value.send.assert_called_once_with(
+            b"test_counter:5|c|#foo:bar\ntest_counter:2|c|#foo:baz\ntest_gauge:4.0|g"
+        )
+        assert client._dogstatsd_client is not None
+        assert client._dogstatsd_client.packets_sent == 1
+        client.close()
+
+    def test_dogstatsd_aggregates_are_packed_up_to_max_packet_size(self) -> None:
+        client = MetricsClient(
+            dogstatsd_enabled=True,
+            dogstatsd_aggregation_enabled=True,
+            dogstatsd_flush_interval=3600,
+            dogstatsd_max_packet_size=64,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.HISTOGRAM,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        sent = Event()
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            statsd.get_socket.return_value.send.side_effect = lambda packet: sent.set()
+            for value in range(10):
+                client.set_histogram_value(metric, value=float(value))
+            # NOTE: the buffer is over the max packet size, the flusher is woken up early.
+            assert sent.wait(timeout=5)
+            client.close()
+
+        packets = [call.args[0] for call in statsd.get_socket.return_value.send.call_args_list]
+        assert all(len(packet) <= 64 for packet in packets)
+        assert b"\n".join(packets).split(b"\n") == [
+            f"test_metric:{float(value)}|h".encode() for value in range(10)
+        ]
+
+    def test_dogstatsd_client_uses_unix_domain_socket(self) -> None:
+        with patch("snyk_metrics.clients.dogstatsd.DogStatsd") as dogstatsd:
+            client = MetricsClient(
+                dogstatsd_enabled=True,
+                dogstatsd_socket_path="/var/run/datadog/dsd.socket",
+            )
+        dogstatsd.assert_called_once_with(
+            host="datadog", port=8125, socket_path="/var/run/datadog/dsd.socket"
+        )
+        assert client._dogstatsd_client is not None
+        assert client._dogstatsd_client.max_packet_size == 8192
+
+    def test_dogstatsd_client_does_not_change_global_statsd(self) -> None:
+        host, port = statsd.host, statsd.port
+        client = MetricsClient(
+            dogstatsd_enabled=True, dogstatsd_agent_host="localhost", dogstatsd_port=1234
+        )
+        assert client._dogstatsd_client is not None
+        assert client._dogstatsd_client._statsd is not statsd
+        assert (statsd.host, statsd.port) == (host, port)
+
+    def test_dispatch_does_not_block_callers_on_slow_backends(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            dispatch_enabled=True,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        assert client._prometheus_client is not None
+        release = Event()
+        increment_counter = client._prometheus_client.increment_counter
+
+        def slow_increment_counter(*args: Any) -> None:
+            release.wait()
+            increment_counter(*args)
+
+        with patch.object(
+            client._prometheus_client, "increment_counter", side_effect=slow_increment_counter
+        ):
+            client.increment_counter(metric, value=2)
+            client.increment_counter(metric, value=3)
+            assert prometheus_registry.get_sample_value("test_metric_total") == 0
+            release.set()
+            client.flush()
+
+        assert prometheus_registry.get_sample_value("test_metric_total") == 5
+        client.close()
+
+    def test_dispatch_drops_newest_events_when_queue_is_full(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            dispatch_enabled=True,
+            dispatch_queue_size=1,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        assert client._prometheus_client is not None
+        started, release = Event(), Event()
+
+        def slow_set_gauge_value(*args: Any) -> None:
+            started.set()
+            release.wait()
+
+        with patch.object(
+            client._prometheus_client, "set_gauge_value", side_effect=slow_set_gauge_value
+        ) as set_gauge_value:
+            client.set_gauge_value(metric, value=1.0)
+            assert started.wait(timeout=5)
+            client.set_gauge_value(metric, value=2.0)
+            client.set_gauge_value(metric, value=3.0)
+            release.set()
+            client.flush()
+
+        assert client.dropped_events == {"prometheus": 1}
+        assert [call.args[2] for call in set_gauge_value.call_args_list] == [1.0, 2.0]
+        client.close()
+
+    def test_dispatch_drops_oldest_events_when_queue_is_full(self) -> None:
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=CollectorRegistry(),
+            dispatch_enabled=True,
+            dispatch_queue_size=1,
+            dispatch_overflow_policy="drop_oldest",
+        )
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        assert client._prometheus_client is not None
+        started, release = Event(), Event()
+
+        def slow_set_gauge_value(*args: Any) -> None:
+            started.set()
+            release.wait()
+
+        with patch.object(
+            client._prometheus_client, "set_gauge_value", side_effect=slow_set_gauge_value
+        ) as set_gauge_value:
+            client.set_gauge_value(metric, value=1.0)
+            assert started.wait(timeout=5)
+            client.set_gauge_value(metric, value=2.0)
+            client.set_gauge_value(metric, value=3.0)
+            release.set()
+            client.flush()
+
+        assert client.dropped_events == {"prometheus": 1}
+        assert [call.args[2] for call in set_gauge_value.call_args_list] == [1.0, 3.0]
+        client.close()
+
+    def test_unknown_dispatch_overflow_policy_raises(self) -> None:
+        with pytest.raises(ValueError):
+            MetricsClient(
+                prometheus_enabled=True,
+                prometheus_registry=CollectorRegistry(),
+                dispatch_enabled=True,
+                dispatch_overflow_policy="drop_everything",
+            )
+
+    def test_pushgateway_push_does_not_block_the_event_loop(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            prometheus_registry=prometheus_registry,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        release = Event()
+        push_threads = []
+
+        def slow_push(*args: Any, **kwargs: Any) -> None:
+            push_threads.append(current_thread())
+            release.wait()
+
+        async def handler() -> None:
+            client.register_metric(metric)
+            for _ in range(10):
+                client.increment_counter(metric)
+            # NOTE: the loop is still responsive while the push is blocked.
+            await asyncio.sleep(0)
+            release.set()
+            await client.aflush()
+            await client.aclose()
+
+        with patch(
+            "snyk_metrics.clients.prometheus.push_to_gateway", side_effect=slow_push
+        ) as push_to_gateway:
+            asyncio.run(handler())
+
+        # NOTE: the first push, one coalesced follow-up push and the one from aflush.
+        assert 1 <= push_to_gateway.call_count <= 3
+        assert main_thread() not in push_threads
+        assert prometheus_registry.get_sample_value("test_metric_total") == 10
+
+    def test_prometheus_multiprocess_mode_merges_workers_values(self) -> None:
+        with TemporaryDirectory() as multiprocess_dir, patch.dict(os.environ), patch.object(
+            values, "ValueClass", values.ValueClass
+        ):
+            client = MetricsClient(
+                prometheus_enabled=True,
+                prometheus_registry=CollectorRegistry(),
+                prometheus_multiprocess_dir=multiprocess_dir,
+            )
+            counter = Metric(
+                metric_type=MetricTypes.COUNTER,
+                name="test_counter",
+                documentation="Test",
+                label_names=None,
+            )
+            gauge = Metric(
+                metric_type=MetricTypes.GAUGE,
+                name="test_gauge",
+                documentation="Test",
+                label_names=None,
+                multiprocess_mode="livesum",
+            )
+            client.register_metric(counter)
+            client.register_metric(gauge)
+
+            def worker() -> None:
+                client.increment_counter(counter, value=2)
+                client.set_gauge_value(gauge, value=5.0)
+
+            process = get_context("fork").Process(target=worker)
+            process.start()
+            process.join()
+            client.increment_counter(counter)
+            client.set_gauge_value(gauge, value=1.0)
+
+            assert client._prometheus_client is not None
+            registry = client._prometheus_client.exposition_registry
+            assert registry.get_sample_value("test_counter_total") == 3
+            assert registry.get_sample_value("test_gauge") == 6.0
+
+            assert process.pid is not None
+            mark_process_dead(process.pid)
+            assert registry.get_sample_value("test_gauge") == 1.0
+            client.close()
+
+    def test_metrics_are_registered_in_bulk_with_a_single_push(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        metrics = [
+            Metric(
+                metric_type=MetricTypes.COUNTER,
+                name=f"test_metric_{index}",
+                documentation="Test",
+                label_names=None,
+            )
+            for index in range(10)
+        ]
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push_to_gateway:
+            client = MetricsClient(
+                metrics=metrics,
+                prometheus_enabled=True,
+                pushgateway_enabled=True,
+                pushgateway_job_name="pytest",
+                pushgateway_host="localhost",
+                pushgateway_port=9091,
+                prometheus_registry=prometheus_registry,
+            )
+
+        push_to_gateway.assert_called_once_with("localhost:9091", "pytest", prometheus_registry)
+        assert len(client.registry) == 10
+        assert prometheus_registry.get_sample_value("test_metric_9_total") == 0
+
+    def test_bulk_registration_registers_all_but_the_duplicates(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metrics = [
+            Metric(
+                metric_type=MetricTypes.COUNTER,
+                name=name,
+                documentation="Test",
+                label_names=None,
+            )
+            for name in ("test_metric", "other_metric", "test_metric")
+        ]
+        with pytest.raises(MetricAlreadyRegisteredError) as exc:
+            client.register_metrics(metrics)
+
+        assert str(exc.value) == "test_metric"
+        assert set(client.registry) == {"test_metric", "other_metric"}
+        assert prometheus_registry.get_sample_value("other_metric_total") == 0
+
+    def test_duplicates_are_reported_when_initialising_without_raising(self) -> None:
+        metrics = [
+            Metric(
+                metric_type=MetricTypes.COUNTER,
+                name=name,
+                documentation="Test",
+                label_names=None,
+            )
+            for name in ("test_metric", "test_metric", "other_metric")
+        ]
+        with patch("snyk_metrics.client.logger") as logger:
+            client = MetricsClient(metrics=metrics, raise_exceptions=False)
+
+        assert set(client.registry) == {"test_metric", "other_metric"}
+        logger.warning.assert_called_once_with(
+            "MetricAlreadyRegisteredError: test_metric", stack_info=True
+        )
+
+    def test_failed_bulk_registration_leaves_no_collectors_behind(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        Counter("other_metric", "Test", registry=prometheus_registry)
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metrics = [
+            Metric(
+                metric_type=MetricTypes.COUNTER,
+                name=name,
+                documentation="Test",
+                label_names=None,
+            )
+            for name in ("test_metric", "other_metric")
+        ]
+        with pytest.raises(ValueError):
+            client.register_metrics(metrics)
+
+        assert client.registry == {}
+        assert prometheus_registry.get_sample_value("test_metric_total") is None
+        client.register_metric(metrics[0])
+        assert prometheus_registry.get_sample_value("test_metric_total") == 0
+
+    def test_new_series_overflow_once_max_series_is_reached(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("user",),
+            max_series=2,
+        )
+        client.register_metric(metric)
+        for user in ("a", "b", "c", "d", "a"):
+            client.increment_counter(metric, labels={"user": user})
+
+        assert prometheus_registry.get_sample_value("test_metric_total", {"user": "a"}) == 2
+        assert prometheus_registry.get_sample_value("test_metric_total", {"user": "c"}) is None
+        assert (
+            prometheus_registry.get_sample_value("test_metric_total", {"user": "__other__"}) == 2
+        )
+        usage = client.series_usage()["test_metric"]
+        assert usage.series == 2
+        assert usage.overflowed == 2
+
+    def test_least_recently_updated_series_is_evicted(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("user",),
+            max_series=2,
+            evict_series=True,
+        )
+        client.register_metric(metric)
+        client.set_gauge_value(metric, labels={"user": "a"}, value=1.0)
+        client.set_gauge_value(metric, labels={"user": "b"}, value=2.0)
+        client.set_gauge_value(metric, labels={"user": "a"}, value=3.0)
+        client.set_gauge_value(metric, labels={"user": "c"}, value=4.0)
+
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "a"}) == 3.0
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "b"}) is None
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "c"}) == 4.0
+        assert client.series_usage()["test_metric"].evicted == 1
+
+    def test_bound_series_is_admitted_again_once_evicted(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("user",),
+            max_series=1,
+            evict_series=True,
+        )
+        client.register_metric(metric)
+        (set_a,) = client.bind_metric(metric, {"user": "a"})
+        set_a(1.0)
+        client.set_gauge_value(metric, labels={"user": "b"}, value=2.0)
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "a"}) is None
+
+        set_a(3.0)
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "a"}) == 3.0
+        assert prometheus_registry.get_sample_value("test_metric", {"user": "b"}) is None
+        assert client.series_usage()["test_metric"].evicted == 2
+
+    def test_series_usage_reports_unbounded_metrics(self) -> None:
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=CollectorRegistry())
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("user",),
+        )
+        client.register_metric(metric)
+        for user in ("a", "b", "c"):
+            client.increment_counter(metric, labels={"user": user})
+
+        usage = client.series_usage()["test_metric"]
+        assert usage.series == 3
+        assert usage.bytes > 0
+
+    def test_series_not_updated_within_ttl_are_removed_on_collection(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+            series_ttl=60.0,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.clients.prometheus.time.monotonic") as monotonic:
+            monotonic.return_value = 0.0
+            client.set_gauge_value(metric, labels={"queue": "a"}, value=1.0)
+            client.set_gauge_value(metric, labels={"queue": "b"}, value=1.0)
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) == 1.0
+
+            monotonic.return_value = 30.0
+            client.set_gauge_value(metric, labels={"queue": "b"}, value=2.0)
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "b"}) == 2.0
+
+            monotonic.return_value = 61.0
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) is None
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "b"}) == 2.0
+
+            monotonic.return_value = 91.0
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "b"}) is None
+
+    def test_series_set_to_the_same_value_do_not_expire(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+            series_ttl=60.0,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.clients.prometheus.time.monotonic") as monotonic:
+            for now in (0.0, 50.0, 100.0):
+                monotonic.return_value = now
+                client.set_gauge_value(metric, labels={"queue": "a"}, value=0.0)
+                assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) == 0.0
+
+    def test_expired_series_are_released_from_the_series_limit(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+            max_series=1,
+            series_ttl=60.0,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.clients.prometheus.time.monotonic") as monotonic:
+            monotonic.return_value = 0.0
+            client.set_gauge_value(metric, labels={"queue": "a"}, value=1.0)
+
+            monotonic.return_value = 61.0
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) is None
+            client.set_gauge_value(metric, labels={"queue": "b"}, value=2.0)
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "b"}) == 2.0
+            assert (
+                prometheus_registry.get_sample_value("test_metric", {"queue": "__other__"}) is None
+            )
+
+        assert client.series_usage()["test_metric"].series == 1
+
+    def test_histogram_values_are_observed_in_prometheus(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.HISTOGRAM,
+            name="test_metric",
+            documentation="Test",
+            label_names=("label",),
+            buckets=(0.1, 1.0),
+        )
+        client.register_metric(metric)
+        for value in (0.05, 0.5, 5.0):
+            client.set_histogram_value(metric, labels={"label": "test"}, value=value)
+
+        labels = {"label": "test"}
+        assert (
+            prometheus_registry.get_sample_value("test_metric_bucket", {**labels, "le": "0.1"})
+            == 1
+        )
+        assert (
+            prometheus_registry.get_sample_value("test_metric_bucket", {**labels, "le": "1.0"})
+            == 2
+        )
+        assert prometheus_registry.get_sample_value("test_metric_count", labels) == 3
+        assert prometheus_registry.get_sample_value("test_metric_sum", labels) == 5.55
+
+    def test_compact_histogram_exposes_the_same_samples(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        regular, compact = (
+            Metric(
+                metric_type=MetricTypes.HISTOGRAM,
+                name=name,
+                documentation="Test",
+                label_names=("label",),
+                buckets=exponential_buckets(0.001, 2, 20),
+                compact_buckets=compact_buckets,
+            )
+            for name, compact_buckets in (("regular", False), ("compact", True))
+        )
+        client.register_metrics([regular, compact])
+        for value in (0.0005, 0.001, 0.003, 0.2, 0.2, 7.5, 5000.0):
+            client.set_histogram_value(regular, labels={"label": "test"}, value=value)
+            client.set_histogram_value(compact, labels={"label": "test"}, value=value)
+
+        samples = {
+            family.name: [
+                (sample.name.split("_", 1)[1], sample.labels, sample.value)
+                for sample in family.samples
+                if not sample.name.endswith("_created")
+            ]
+            for family in prometheus_registry.collect()
+        }
+        assert len(samples["compact"]) == 23
+        assert samples["compact"] == samples["regular"]
+
+    def test_summary_quantiles_are_exposed_to_prometheus(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.SUMMARY,
+            name="test_metric",
+            documentation="Test",
+            label_names=("label",),
+            quantiles=(0.5, 0.99),
+        )
+        client.register_metric(metric)
+        for value in range(1, 1001):
+            client.set_summary_value(metric, labels={"label": "test"}, value=value)
+
+        labels = {"label": "test"}
+        median = prometheus_registry.get_sample_value("test_metric", {**labels, "quantile": "0.5"})
+        assert median == pytest.approx(500, rel=0.01)
+        p99 = prometheus_registry.get_sample_value("test_metric", {**labels, "quantile": "0.99"})
+        assert p99 == pytest.approx(990, rel=0.01)
+        assert prometheus_registry.get_sample_value("test_metric_count", labels) == 1000
+
+    def test_summary_value_is_sent_as_a_dogstatsd_distribution(self) -> None:
+        client = MetricsClient(dogstatsd_enabled=True)
+        metric = Metric(
+            metric_type=MetricTypes.SUMMARY,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            client.set_summary_value(metric, labels={"foo": "bar"}, value=0.25)
+
+        statsd.distribution.assert_called_once_with(
+            metric="test_metric", tags=["foo:bar"], value=0.25
+        )
+
+    def test_gauge_callback_is_evaluated_when_prometheus_is_collected(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+        )
+        client.register_metric(metric)
+        queue: List[int] = []
+        client.set_gauge_callback(metric, lambda: len(queue), labels={"queue": "a"})
+
+        assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) == 0
+        queue.extend(range(3))
+        assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) == 3
+
+    def test_failing_or_slow_gauge_callbacks_report_nan(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            gauge_callback_timeout=0.05,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("source",),
+        )
+        client.register_metric(metric)
+        release = Event()
+
+        def slow_callback() -> float:
+            release.wait()
+            return 1.0
+
+        client.set_gauge_callback(metric, lambda: 1 / 0, labels={"source": "failing"})
+        client.set_gauge_callback(metric, slow_callback, labels={"source": "slow"})
+        try:
+            failing = prometheus_registry.get_sample_value("test_metric", {"source": "failing"})
+            slow = prometheus_registry.get_sample_value("test_metric", {"source": "slow"})
+        finally:
+            release.set()
+        assert failing is not None and math.isnan(failing)
+        assert slow is not None and math.isnan(slow)
+
+    def test_stuck_gauge_callbacks_do_not_block_the_others(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            gauge_callback_timeout=0.05,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("source",),
+        )
+        client.register_metric(metric)
+        release = Event()
+        calls = []
+
+        def stuck_callback() -> float:
+            calls.append(current_thread())
+            release.wait()
+            return 1.0
+
+        for source in ("stuck_a", "stuck_b"):
+            client.set_gauge_callback(metric, stuck_callback, labels={"source": source})
+        client.set_gauge_callback(metric, lambda: 2.0, labels={"source": "healthy"})
+        try:
+            with patch("snyk_metrics.callbacks.logger"):
+                for _ in range(3):
+                    healthy = prometheus_registry.get_sample_value(
+                        "test_metric", {"source": "healthy"}
+                    )
+                    assert healthy == 2.0
+        finally:
+            release.set()
+        assert len(calls) == 2
+
+    def test_callback_gauges_do_not_expire(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+            series_ttl=60.0,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.clients.prometheus.time.monotonic") as monotonic:
+            monotonic.return_value = 0.0
+            client.set_gauge_callback(metric, lambda: 3.0, labels={"queue": "a"})
+
+            monotonic.return_value = 120.0
+            assert prometheus_registry.get_sample_value("test_metric", {"queue": "a"}) == 3.0
+
+    def test_gauge_callback_is_sampled_on_dogstatsd_flush(self) -> None:
+        client = MetricsClient(dogstatsd_enabled=True, dogstatsd_flush_interval=3600)
+        metric = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_metric",
+            documentation="Test",
+            label_names=("queue",),
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            client.set_gauge_callback(metric, lambda: 7, labels={"queue": "a"})
+            statsd.gauge.assert_not_called()
+            client.flush()
+
+        statsd.gauge.assert_called_once_with(metric="test_metric", tags=["queue:a"], value=7)
+        client.close()
+
+    def test_unsampled_updates_skip_validation_and_backends(self) -> None:
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=CollectorRegistry())
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+            sample_rate=0.5,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.client._random", return_value=0.9), patch.object(
+            client, "_validate_metric"
+        ) as validate_metric:
+            client.increment_counter(metric, labels={"foo": "bar"})
+        validate_metric.assert_not_called()
+
+    def test_sampled_prometheus_counter_is_scaled(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.client._random", side_effect=[0.1, 0.3]):
+            client.increment_counter(metric, labels={"foo": "bar"}, sample_rate=0.25)
+            client.increment_counter(metric, labels={"foo": "bar"}, sample_rate=0.25)
+
+        assert prometheus_registry.get_sample_value("test_metric_total", {"foo": "bar"}) == 4
+
+    def test_sample_rate_is_sent_to_dogstatsd(self) -> None:
+        client = MetricsClient(dogstatsd_enabled=True)
+        metric = Metric(
+            metric_type=MetricTypes.HISTOGRAM,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+            sample_rate=0.5,
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd, patch(
+            "snyk_metrics.client._random", return_value=0.1
+        ):
+            client.set_histogram_value(metric, labels={"foo": "bar"}, value=3)
+
+        statsd.histogram.assert_not_called()
+        statsd.get_socket().send.assert_called_once_with(b"test_metric:3|h|@0.5|#foo:bar")
+
+    def test_batch_is_pushed_to_pushgateway_once(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            pushgateway_job_name="pytest",
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            prometheus_registry=prometheus_registry,
+        )
+        counter, histogram = (
+            Metric(
+                metric_type=metric_type,
+                name=name,
+                documentation="Test",
+                label_names=("endpoint",),
+            )
+            for metric_type, name in (
+                (MetricTypes.COUNTER, "test_requests"),
+                (MetricTypes.HISTOGRAM, "test_duration"),
+            )
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push_to_gateway:
+            client.register_metrics([counter, histogram])
+            push_to_gateway.reset_mock()
+            with client.batch() as batch:
+                batch.increment_counter(counter, labels={"endpoint": "/x"})
+                batch.increment_counter(counter, labels={"endpoint": "/x"})
+                batch.set_histogram_value(histogram, labels={"endpoint": "/x"}, value=0.5)
+
+        push_to_gateway.assert_called_once()
+        labels = {"endpoint": "/x"}
+        assert prometheus_registry.get_sample_value("test_requests_total", labels) == 2
+        assert prometheus_registry.get_sample_value("test_duration_count", labels) == 1
+
+    def test_batch_validates_each_metric_once(self) -> None:
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=CollectorRegistry())
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        events = [MetricEvent(metric, 1, {"foo": value}) for value in ("a", "b", "c")]
+        with patch.object(client, "_validate_metric") as validate_metric:
+            client.record_many(events)
+        validate_metric.assert_called_once_with(metric, MetricTypes.COUNTER, {"foo": "a"})
+
+    def test_invalid_batch_raises_before_recording(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with pytest.raises(MetricTypeMismatchError):
+            with client.batch() as batch:
+                batch.increment_counter(metric, labels={"foo": "bar"})
+                batch.set_gauge_value(metric, labels={"foo": "bar"}, value=1.0)
+
+        assert prometheus_registry.get_sample_value("test_metric_total", {"foo": "bar"}) is None
+
+    def test_invalid_batch_events_are_suppressed_one_by_one(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            raise_exceptions=False,
+        )
+        counter = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_counter",
+            documentation="Test",
+            label_names=None,
+        )
+        gauge = Metric(
+            metric_type=MetricTypes.GAUGE,
+            name="test_gauge",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metrics([counter, gauge])
+        with patch("snyk_metrics.client.logger") as logger:
+            with client.batch() as batch:
+                batch.increment_counter(counter)
+                batch.set_gauge_value(gauge, labels={"bar": "baz"}, value=1.0)
+                batch.set_gauge_value(gauge, labels={"foo": "bar"}, value=2.0)
+
+        assert prometheus_registry.get_sample_value("test_counter_total") == 1
+        assert prometheus_registry.get_sample_value("test_gauge", {"foo": "bar"}) == 2.0
+        logger.warning.assert_called_once()
+
+    def test_batch_is_sent_to_dogstatsd_in_one_datagram(self) -> None:
+        client = MetricsClient(dogstatsd_enabled=True)
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            client.record_many(
+                [MetricEvent(metric, 1, {"foo": "a"}), MetricEvent(metric, 2, {"foo": "b"})]
+            )
+
+        statsd.get_socket().send.assert_called_once_with(
+            b"test_metric:1|c|#foo:a\ntest_metric:2|c|#foo:b"
+        )
+
+    def test_keepalive_transport_reuses_its_connection(self) -> None:
+        with PushgatewayStandIn() as gateway:
+            client = MetricsClient(
+                prometheus_enabled=True,
+                pushgateway_enabled=True,
+                pushgateway_host=gateway.host,
+                pushgateway_port=gateway.port,
+                pushgateway_job_name="pytest",
+                pushgateway_username="foo",
+                pushgateway_password="bar",
+                pushgateway_keepalive=True,
+                pushgateway_gzip=True,
+                prometheus_registry=CollectorRegistry(),
+            )
+            metric = Metric(
+                metric_type=MetricTypes.COUNTER,
+                name="test_metric",
+                documentation="Test",
+                label_names=None,
+            )
+            client.register_metric(metric)
+            for _ in range(10):
+                client.increment_counter(metric)
+            client.close()
+
+        assert gateway.pushes == 11
+        assert gateway.connections == 1
+        headers, body = gateway.last_push
+        assert headers["Authorization"] == "Basic Zm9vOmJhcg=="
+        assert headers["Content-Encoding"] == "gzip"
+        assert b"test_metric_total 10.0" in gzip.decompress(body)
+
+    def test_keepalive_transport_opens_one_connection_instead_of_one_per_push(self) -> None:
+        pushes = 10
+        registry = CollectorRegistry()
+        Counter("test_metric", "Test", registry=registry).inc()
+        with PushgatewayStandIn() as gateway:
+            for _ in range(pushes):
+                push_to_gateway(f"{gateway.host}:{gateway.port}", "pytest", registry)
+            assert gateway.connections == pushes
+
+            transport = PushgatewayTransport(gateway.host, gateway.port, "pytest")
+            for _ in range(pushes):
+                transport.push(registry)
+            transport.close()
+
+        assert gateway.pushes == 2 * pushes
+        assert gateway.connections == pushes + 1
+
+    def test_keepalive_transport_accepts_a_scheme_in_the_host(self) -> None:
+        registry = CollectorRegistry()
+        Counter("test_metric", "Test", registry=registry).inc()
+        with PushgatewayStandIn() as gateway:
+            transport = PushgatewayTransport(f"http://{gateway.host}", gateway.port, "pytest")
+            transport.push(registry)
+            transport.close()
+        assert gateway.pushes == 1
+
+        transport = PushgatewayTransport("https://pushgateway", 9091, "pytest")
+        connection, _ = transport._acquire()
+        assert isinstance(connection, HTTPSConnection)
+        assert connection.host == "pushgateway"
+        with pytest.raises(ValueError):
+            PushgatewayTransport("ftp://pushgateway", 9091, "pytest")
+
+    def test_delta_push_only_sends_changed_metrics(self) -> None:
+        with PushgatewayStandIn() as gateway:
+            client = MetricsClient(
+                prometheus_enabled=True,
+                pushgateway_enabled=True,
+                pushgateway_host=gateway.host,
+                pushgateway_port=gateway.port,
+                pushgateway_job_name="pytest",
+                pushgateway_keepalive=True,
+                pushgateway_delta=True,
+                prometheus_registry=CollectorRegistry(),
+            )
+            metrics = [
+                Metric(
+                    metric_type=MetricTypes.COUNTER,
+                    name=name,
+                    documentation="Test",
+                    label_names=None,
+                )
+                for name in ("test_metric", "test_other_metric")
+            ]
+            client.register_metrics(metrics)
+            _, registration_body = gateway.last_push
+            client.increment_counter(metrics[0])
+            client.close()
+
+        assert gateway.requests == [
+            ("PUT", "/metrics/job/pytest"),
+            ("POST", "/metrics/job/pytest"),
+        ]
+        assert b"test_metric_total 0.0" in registration_body
+        assert b"test_other_metric_total 0.0" in registration_body
+        _, body = gateway.last_push
+        assert b"test_metric_total 1.0" in body
+        assert b"test_other_metric" not in body
+
+    def test_failed_delta_push_is_retried_with_the_next_one(self) -> None:
+        registry = CollectorRegistry()
+        client = PrometheusClient(
+            pushgateway_enabled=True,
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            pushgateway_job_name="pytest",
+            pushgateway_delta=True,
+            registry=registry,
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway"):
+            client.register_metric("counter", "test_metric", "Test")
+        with patch("snyk_metrics.clients.prometheus.pushadd_to_gateway"):
+            client.register_metric("counter", "test_other_metric", "Test")
+        with patch(
+            "snyk_metrics.clients.prometheus.pushadd_to_gateway", side_effect=OSError
+        ), pytest.raises(OSError):
+            client.increment_counter("test_metric")
+        with patch("snyk_metrics.clients.prometheus.pushadd_to_gateway") as pushadd:
+            client.increment_counter("test_other_metric")
+
+        pushed_registry = pushadd.call_args.args[2]
+        assert {family.name for family in pushed_registry.collect()} == {
+            "test_metric",
+            "test_other_metric",
+        }
+
+    def test_delta_pushes_replace_the_group_on_refresh_and_include_expiring_metrics(
+        self,
+    ) -> None:
+        client = PrometheusClient(
+            pushgateway_enabled=True,
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            pushgateway_job_name="pytest",
+            pushgateway_delta=True,
+            registry=CollectorRegistry(),
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push:
+            client.register_metric("gauge", "test_metric", "Test", ("queue",), series_ttl=60.0)
+        push.assert_called_once()
+
+        with patch("snyk_metrics.clients.prometheus.pushadd_to_gateway") as pushadd:
+            client.register_metric("counter", "test_other_metric", "Test")
+            client.register_metric("counter", "test_third_metric", "Test")
+        pushed_registry = pushadd.call_args.args[2]
+        assert {family.name for family in pushed_registry.collect()} == {
+            "test_metric",
+            "test_third_metric",
+        }
+
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway") as push:
+            client._push_to_gateway()
+        push.assert_called_once()
+
+    def test_unreachable_pushgateway_is_skipped_once_the_circuit_opens(self) -> None:
+        client = MetricsClient(
+            prometheus_enabled=True,
+            pushgateway_enabled=True,
+            pushgateway_job_name="pytest",
+            pushgateway_host="localhost",
+            pushgateway_port=9091,
+            prometheus_registry=CollectorRegistry(),
+            raise_exceptions=False,
+            circuit_breaker_threshold=2,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        with patch("snyk_metrics.clients.prometheus.push_to_gateway"):
+            client.register_metric(metric)
+        with patch(
+            "snyk_metrics.clients.prometheus.push_to_gateway", side_effect=OSError
+        ) as push_to_gateway:
+            for _ in range(10):
+                client.increment_counter(metric)
+
+        assert push_to_gateway.call_count == 2
+
+    def test_failing_dogstatsd_socket_is_skipped_once_the_circuit_opens(self) -> None:
+        client = MetricsClient(dogstatsd_enabled=True, circuit_breaker_threshold=2)
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        with patch.object(client._dogstatsd_client, "_statsd") as statsd:
+            statsd.get_socket().send.side_effect = OSError
+            for _ in range(10):
+                client.record_many([MetricEvent(metric, 1)])
+
+        assert statsd.get_socket().send.call_count == 2
+        assert client._dogstatsd_client.packets_dropped == 10
+
+    def test_suppressed_exceptions_are_summarised(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            raise_exceptions=False,
+            error_reporting="summary",
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=("foo",),
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.client.logger") as client_logger, patch(
+            "snyk_metrics.reporting.logger"
+        ) as reporting_logger, patch.object(
+            client._prometheus_client, "increment_counter"
+        ) as increment_counter:
+            for _ in range(100):
+                client.increment_counter(metric, labels={"bar": "baz"})
+
+        client_logger.warning.assert_not_called()
+        reporting_logger.warning.assert_called_once()
+        increment_counter.assert_not_called()
+        labels = {"metric": "test_metric", "exception": "MetricLabelMismatchError"}
+        assert (
+            prometheus_registry.get_sample_value(
+                "snyk_metrics_suppressed_exceptions_total", labels
+            )
+            == 100
+        )
+
+    def test_metrics_are_exposed_over_http(self) -> None:
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=CollectorRegistry(),
+            prometheus_http_port=0,
+            prometheus_http_addr="127.0.0.1",
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        client.increment_counter(metric)
+        url = f"http://127.0.0.1:{client._prometheus_client.http_server.port}/metrics"
+        with urlopen(url) as response:
+            text_body = response.read()
+        request = Request(
+            url,
+            headers={"Accept": "application/openmetrics-text", "Accept-Encoding": "gzip"},
+        )
+        with urlopen(request) as response:
+            openmetrics_headers, openmetrics_body = response.headers, response.read()
+        client.close()
+
+        assert b"test_metric_total 1.0" in text_body
+        assert openmetrics_headers["Content-Encoding"] == "gzip"
+        assert openmetrics_headers["Content-Type"].startswith("application/openmetrics-text")
+        assert gzip.decompress(openmetrics_body).endswith(b"# EOF\n")
+
+    def test_self_instrumentation_is_exported_with_the_metrics(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            dogstatsd_enabled=True,
+            dogstatsd_agent_host="127.0.0.1",
+            prometheus_registry=prometheus_registry,
+            raise_exceptions=False,
+            self_instrumentation=True,
+            self_instrumentation_sample_rate=1,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        with patch("snyk_metrics.client.logger"):
+            for _ in range(3):
+                client.increment_counter(metric)
+            client.increment_counter(metric, labels={"foo": "bar"})
+
+        assert prometheus_registry.get_sample_value("test_metric_total") == 3
+        assert prometheus_registry.get_sample_value("snyk_metrics_validation_seconds_count") == 3
+        for backend in ("prometheus", "dogstatsd"):
+            assert (
+                prometheus_registry.get_sample_value(
+                    "snyk_metrics_emit_seconds_count", {"backend": backend}
+                )
+                == 3
+            )
+        assert (
+            prometheus_registry.get_sample_value(
+                "snyk_metrics_dogstatsd_packets_total", {"outcome": "sent"}
+            )
+            >= 3
+        )
+        assert (
+            prometheus_registry.get_sample_value(
+                "snyk_metrics_suppressed_exceptions_total",
+                {"metric": "test_metric", "exception": "MetricLabelMismatchError"},
+            )
+            == 1
+        )
+        client.close()
+        assert (
+            prometheus_registry.get_sample_value(
+                "snyk_metrics_dogstatsd_packets_total", {"outcome": "sent"}
+            )
+            is None
+        )
+
+    def test_dispatched_backend_calls_are_timed_by_the_worker(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        client = MetricsClient(
+            prometheus_enabled=True,
+            prometheus_registry=prometheus_registry,
+            dispatch_enabled=True,
+            self_instrumentation=True,
+            self_instrumentation_sample_rate=1,
+        )
+        metric = Metric(
+            metric_type=MetricTypes.COUNTER,
+            name="test_metric",
+            documentation="Test",
+            label_names=None,
+        )
+        client.register_metric(metric)
+        with patch.object(
+            PrometheusClient, "increment_counter", side_effect=lambda *args: time.sleep(0.02)
+        ):
+            for _ in range(3):
+                client.increment_counter(metric)
+            client.flush()
+
+        labels = {"backend": "prometheus"}
+        assert prometheus_registry.get_sample_value("snyk_metrics_emit_seconds_count", labels) == 3
+        assert (
+            prometheus_registry.get_sample_value("snyk_metrics_emit_seconds_sum", labels) >= 0.06
+        )
+        client.close()
+
+    def test_pushes_are_instrumented(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        with PushgatewayStandIn() as gateway:
+            client = MetricsClient(
+                prometheus_enabled=True,
+                pushgateway_enabled=True,
+                pushgateway_host=gateway.host,
+                pushgateway_port=gateway.port,
+                pushgateway_job_name="pytest",
+                prometheus_registry=prometheus_registry,
+                self_instrumentation=True,
+            )
+            _, body = gateway.last_push
+
+        assert prometheus_registry.get_sample_value("snyk_metrics_pushgateway_pushes_total") == 1
+        assert prometheus_registry.get_sample_value(
+            "snyk_metrics_pushgateway_pushed_bytes_total"
+        ) == len(body)
+        assert (
+            prometheus_registry.get_sample_value("snyk_metrics_pushgateway_push_seconds_total") > 0
+        )
+        client.close()
+
+    def test_partitioned_push_spreads_metrics_across_grouping_keys(self) -> None:
+        names = [f"test_metric_{index}" for index in range(20)]
+        with PushgatewayStandIn() as gateway:
+            client = MetricsClient(
+                prometheus_enabled=True,
+                pushgateway_enabled=True,
+                pushgateway_host=gateway.host,
+                pushgateway_port=gateway.port,
+                pushgateway_job_name="pytest",
+                pushgateway_keepalive=True,
+                pushgateway_partitions=4,
+                prometheus_registry=CollectorRegistry(),
+            )
+            client.register_metrics(
+                [
+                    Metric(
+                        metric_type=MetricTypes.COUNTER,
+                        name=name,
+                        documentation="Test",
+                        label_names=None,
+                    )
+                    for name in names
+                ]
+            )
+            client.close()
+
+        assert sorted(gateway.requests) == [
+            ("PUT", f"/metrics/job/pytest/partition/{index}") for index in range(4)
+        ]
@@ -0,0 +1,50 @@
+import gzip
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter
+
+from snyk_metrics.exposition import CachedExposition
+
+
+def test_rendering_is_cached_for_the_refresh_interval() -> None:
+    registry = CollectorRegistry()
+    counter = Counter("test_metric", "Test", registry=registry)
+    with patch("snyk_metrics.exposition.time.monotonic", return_value=0.0) as monotonic:
+        exposition = CachedExposition(registry, min_refresh_interval=5)
+        rendering = exposition.render()
+        counter.inc()
+        monotonic.return_value = 4.0
+        assert exposition.render() is rendering
+        monotonic.return_value = 5.0
+        refreshed_rendering = exposition.render()
+
+    assert b"test_metric_total 0.0" in rendering.body
+    assert b"test_metric_total 1.0" in refreshed_rendering.body
+
+
+def test_formats_are_rendered_separately() -> None:
+    registry = CollectorRegistry()
+    Counter("test_metric", "Test", registry=registry)
+    exposition = CachedExposition(registry)
+
+    rendering = exposition.render("openmetrics")
+
+    assert rendering.content_type.startswith("application/openmetrics-text")
+    assert rendering.body.endswith(b"# EOF\n")
+    assert exposition.render("text") is not rendering
+
+
+def test_gzipped_body_is_compressed_once() -> None:
+    registry = CollectorRegistry()
+    Counter("test_metric", "Test", registry=registry)
+    rendering = CachedExposition(registry).render()
+
+    assert rendering.gzipped() is rendering.gzipped()
+    assert gzip.decompress(rendering.gzipped()) == rendering.body
+
+
+def test_refresh_interval_must_not_be_negative() -> None:
+    with pytest.raises(ValueError) as exc:
+        CachedExposition(CollectorRegistry(), min_refresh_interval=-1)
+    assert str(exc.value) == "min_refresh_interval must not be negative."
@@ -1,15 +1,19 @@
+import asyncio
+from typing import Optional
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
 import pytest
+from prometheus_client import CollectorRegistry
 
-from snyk_metrics import _destroy_client, initialise
+from snyk_metrics import _destroy_client, get_client, initialise
 from snyk_metrics.exceptions import (
     ClientNotInitialisedError,
     MetricAlreadyRegisteredError,
+    MetricLabelMismatchError,
     RegistryLockedError,
 )
-from snyk_metrics.metrics import Counter, Histogram
+from snyk_metrics.metrics import Counter, Gauge, Histogram
 
 
 class TestCounter(TestCase):
@@ -40,21 +44,36 @@ class TestCounter(TestCase):
         counter = Counter("foo", "foo", label_names=("label",))
         with patch.object(counter._client, "increment_counter", MagicMock()) as increment_counter:
             counter.increment()
-        increment_counter.assert_called_once_with(counter, value=1, labels=None)
+        increment_counter.assert_called_once_with(counter, value=1, labels=None, sample_rate=None)
 
     def test_counter_is_incremented_by_the_specified_amount(self) -> None:
         initialise(lock_registry=False)
         counter = Counter("foo", "foo", label_names=("label",))
         with patch.object(counter._client, "increment_counter", MagicMock()) as increment_counter:
             counter.increment(5)
-        increment_counter.assert_called_once_with(counter, value=5, labels=None)
+        increment_counter.assert_called_once_with(counter, value=5, labels=None, sample_rate=None)
 
     def test_counter_with_labels_is_incremented(self) -> None:
         initialise(lock_registry=False)
         counter = Counter("foo", "foo", label_names=("label",))
         with patch.object(counter._client, "increment_counter", MagicMock()) as increment_counter:
             counter.increment(labels={"label": "test"})
-        increment_counter.assert_called_once_with(counter, value=1, labels={"label": "test"})
+        increment_counter.assert_called_once_with(
+            counter, value=1, labels={"label": "test"}, sample_rate=None
+        )
+
+    def test_counter_created_before_initialise_is_registered(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        counter = Counter("foo", "foo", label_names=("label",))
+        initialise(prometheus_enabled=True, prometheus_registry=prometheus_registry)
+        counter.increment(labels={"label": "test"})
+        assert get_client().registry.get("foo") is counter
+        assert prometheus_registry.get_sample_value("foo_total", labels={"label": "test"}) == 1
+
+    def test_counter_created_before_initialise_can_be_passed_explicitly(self) -> None:
+        counter = Counter("foo", "foo")
+        initialise(metrics=[counter])
+        assert get_client().registry == {"foo": counter}
 
     def test_counter_is_registered_automatically(self) -> None:
         initialise(lock_registry=False)
@@ -64,6 +83,150 @@ class TestCounter(TestCase):
         assert len(counter._client.registry) == 1
         assert counter is counter._client.registry.get("foo")
 
+    def test_bound_counter_is_incremented(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        initialise(
+            lock_registry=False, prometheus_enabled=True, prometheus_registry=prometheus_registry
+        )
+        counter = Counter("foo", "foo", label_names=("endpoint", "method"))
+        bound = counter.labels(endpoint="/x", method="GET")
+        bound.increment()
+        bound.increment(4)
+        assert (
+            prometheus_registry.get_sample_value(
+                "foo_total", labels={"endpoint": "/x", "method": "GET"}
+            )
+            == 5
+        )
+
+    def test_bound_counter_validates_labels_once(self) -> None:
+        initialise(lock_registry=False)
+        counter = Counter("foo", "foo", label_names=("label",))
+        with pytest.raises(MetricLabelMismatchError):
+            counter.labels(other="test")
+
+        bound = counter.labels(label="test")
+        with patch.object(counter._client, "_validate_metric") as validate_metric:
+            bound.increment()
+        validate_metric.assert_not_called()
+
+    def test_bound_counter_is_a_noop_if_exceptions_are_silenced(self) -> None:
+        initialise(
+            lock_registry=False,
+            prometheus_enabled=True,
+            prometheus_registry=CollectorRegistry(),
+            raise_exceptions=False,
+        )
+        counter = Counter("foo", "foo", label_names=("label",))
+        bound = counter.labels(other="test")
+        assert bound._emitters == ()
+        bound.increment()
+
+    def test_bound_counter_uses_preformatted_dogstatsd_tags(self) -> None:
+        initialise(lock_registry=False, dogstatsd_enabled=True)
+        counter = Counter("foo", "foo", label_names=("label",))
+        with patch.object(get_client()._dogstatsd_client, "_statsd") as statsd:
+            bound = counter.labels(label="test")
+            bound.increment(2)
+        statsd.increment.assert_called_once_with("foo", 2, tags=["label:test"])
+
+
+class TestGauge(TestCase):
+    def tearDown(self) -> None:
+        _destroy_client()
+
+    def test_bound_gauge_value_is_set(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        initialise(
+            lock_registry=False, prometheus_enabled=True, prometheus_registry=prometheus_registry
+        )
+        gauge = Gauge("foo", "foo", label_names=("label",))
+        gauge.labels(label="test").set_value(3.5)
+        assert prometheus_registry.get_sample_value("foo", labels={"label": "test"}) == 3.5
+
+    def test_bound_gauge_updates_its_series_once_expired(self) -> None:
+        prometheus_registry = CollectorRegistry()
+        initialise(
+            lock_registry=False, prometheus_enabled=True, prometheus_registry=prometheus_registry
+        )
+        gauge = Gauge("foo", "foo", label_names=("label",), series_ttl=60.0)
+        with patch("snyk_metrics.clients.prometheus.time.monotonic") as monotonic:
+            monotonic.return_value = 0.0
+            bound = gauge.labels(label="test")
+            bound.set_value(3.5)
+
+            monotonic.return_value = 61.0
+            assert prometheus_registry.get_sample_value("foo", labels={"label": "test"}) is None
+            bound.set_value(7.0)
+            assert prometheus_registry.get_sample_value("foo", labels={"label": "test"}) == 7.0
+
+
+class TestTimer(TestCase):
+    def setUp(self) -> None:
+        self.prometheus_registry = CollectorRegistry()
+        initialise(
+            lock_registry=False,
+            prometheus_enabled=True,
+            prometheus_registry=self.prometheus_registry,
+        )
+        self.histogram = Histogram("foo", "foo", label_names=("endpoint", "status"))
+
+    def tearDown(self) -> None:
+        _destroy_client()
+
+    def get_sum(self, **labels: str) -> Optional[float]:
+        return self.prometheus_registry.get_sample_value("foo_sum", labels=labels)
+
+    def test_block_duration_is_observed_in_seconds(self) -> None:
+        with patch("snyk_metrics.metrics.time.perf_counter_ns", side_effect=[0, 250_000_000]):
+            with self.histogram.time(labels={"endpoint": "/x", "status": "200"}):
+                pass
+        assert self.get_sum(endpoint="/x", status="200") == 0.25
+
+    def test_labels_can_be_set_in_the_block(self) -> None:
+        with self.histogram.time(labels={"endpoint": "/x"}) as timer:
+            timer.set_labels(status="500")
+        assert self.get_sum(endpoint="/x", status="500") is not None
+
+    def test_decorated_function_calls_are_timed(self) -> None:
+        @self.histogram.time(labels={"endpoint": "/x", "status": "200"})
+        def handler() -> str:
+            return "response"
+
+        assert handler() == "response"
+        assert handler() == "response"
+        assert (
+            self.prometheus_registry.get_sample_value(
+                "foo_count", labels={"endpoint": "/x", "status": "200"}
+            )
+            == 2
+        )
+
+    def test_decorated_coroutine_calls_are_timed(self) -> None:
+        @self.histogram.time(labels={"endpoint": "/x", "status": "200"})
+        async def handler() -> str:
+            await asyncio.sleep(0.01)
+            return "response"
+
+        assert asyncio.run(handler()) == "response"
+        duration = self.get_sum(endpoint="/x", status="200")
+        assert duration is not None and duration >= 0.01
+
+    def test_only_sampled_calls_are_timed(self) -> None:
+        @self.histogram.time(labels={"endpoint": "/x", "status": "200"}, sample_rate=0.5)
+        def handler() -> None:
+            pass
+
+        with patch("snyk_metrics.metrics._random", side_effect=[0.9, 0.1, 0.7]):
+            for _ in range(3):
+                handler()
+        assert (
+            self.prometheus_registry.get_sample_value(
+                "foo_count", labels={"endpoint": "/x", "status": "200"}
+            )
+            == 1
+        )
+
 
 class TestHistogram:
     def tearDown(self) -> None:
@@ -76,4 +239,6 @@ class TestHistogram:
             histogram._client, "set_histogram_value", MagicMock()
         ) as set_histogram_value:
             histogram.set_value(10, labels={"label": "test"})
-        set_histogram_value.assert_called_once_with(histogram, value=10, labels={"label": "test"})
+        set_histogram_value.assert_called_once_with(
+            histogram, value=10, labels={"label": "test"}, sample_rate=None
+        )
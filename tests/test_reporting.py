@@ -0,0 +1,85 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from snyk_metrics.reporting import ErrorReporter
+
+
+def test_first_exception_is_logged_then_summarised_once_per_interval() -> None:
+    with patch("snyk_metrics.reporting.time.monotonic", return_value=0.0) as monotonic:
+        reporter = ErrorReporter(interval=60)
+        with patch("snyk_metrics.reporting.logger") as logger:
+            for _ in range(100):
+                reporter.report("test_metric", ValueError("bad value"))
+            logger.warning.assert_called_once_with(
+                "Suppressed 1 exceptions: test_metric ValueError x1 (bad value)"
+            )
+            monotonic.return_value = 60.0
+            reporter.report("test_metric", ValueError("bad value"))
+
+    logger.warning.assert_called_with(
+        "Suppressed 100 exceptions: test_metric ValueError x100 (bad value)"
+    )
+    assert reporter.counts == {("test_metric", "ValueError"): 101}
+
+
+def test_pending_exceptions_are_logged_once_the_interval_is_over() -> None:
+    reporter = ErrorReporter(interval=0.05)
+    with patch("snyk_metrics.reporting.logger") as logger:
+        reporter.report("test_metric", ValueError("bad value"))
+        reporter.report("test_metric", ValueError("bad value"))
+        deadline = time.monotonic() + 5
+        while logger.warning.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    logger.warning.assert_called_with(
+        "Suppressed 1 exceptions: test_metric ValueError x1 (bad value)"
+    )
+    assert logger.warning.call_count == 2
+
+
+def test_exception_message_is_formatted_once_per_summary() -> None:
+    class CountedError(Exception):
+        formatted = 0
+
+        def __str__(self) -> str:
+            CountedError.formatted += 1
+            return "counted"
+
+    reporter = ErrorReporter()
+    with patch("snyk_metrics.reporting.logger"):
+        for _ in range(100):
+            reporter.report("test_metric", CountedError())
+        reporter.flush()
+
+    assert CountedError.formatted == 2
+
+
+def test_pending_exceptions_are_logged_on_flush() -> None:
+    reporter = ErrorReporter()
+    reporter.report("test_metric", ValueError("bad value"))
+    reporter.report("", KeyError("foo"))
+    with patch("snyk_metrics.reporting.logger") as logger:
+        reporter.flush()
+        reporter.flush()
+
+    logger.warning.assert_called_once_with("Suppressed 1 exceptions: - KeyError x1 ('foo')")
+
+
+def test_counts_are_collected_as_a_counter() -> None:
+    registry = CollectorRegistry()
+    reporter = ErrorReporter()
+    registry.register(reporter)
+    reporter.report("test_metric", ValueError("bad value"))
+    reporter.report("test_metric", ValueError("bad value"))
+
+    labels = {"metric": "test_metric", "exception": "ValueError"}
+    assert registry.get_sample_value("snyk_metrics_suppressed_exceptions_total", labels) == 2
+
+
+def test_report_interval_must_be_positive() -> None:
+    with pytest.raises(ValueError) as exc:
+        ErrorReporter(interval=0)
+    assert str(exc.value) == "report interval must be greater than 0."
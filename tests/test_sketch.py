@@ -0,0 +1,53 @@
+import math
+import random
+
+import pytest
+
+from snyk_metrics.sketch import SlidingQuantiles, TDigest
+
+
+def test_tdigest_estimates_quantiles_with_bounded_memory() -> None:
+    random.seed(0)
+    values = [random.lognormvariate(0, 1) for _ in range(50000)]
+    digest = TDigest(compression=100)
+    for value in values:
+        digest.add(value)
+
+    values.sort()
+    assert len(digest) <= 100
+    for quantile in (0.5, 0.9, 0.99):
+        assert digest.quantile(quantile) == pytest.approx(
+            values[int(quantile * len(values))], rel=0.05
+        )
+
+
+def test_tdigests_can_be_merged() -> None:
+    digest, other = TDigest(), TDigest()
+    for value in range(1000):
+        (digest if value % 2 else other).add(value)
+    digest.merge(other)
+
+    assert digest.count == 1000
+    assert digest.quantile(0.5) == pytest.approx(500, abs=5)
+
+
+def test_empty_tdigest_quantile_is_nan() -> None:
+    assert math.isnan(TDigest().quantile(0.5))
+
+
+def test_sliding_quantiles_forget_values_older_than_max_age() -> None:
+    quantiles = SlidingQuantiles(quantiles=(0.5,), max_age=10, age_buckets=2)
+    start = quantiles._next_rotation
+    for value in range(100):
+        quantiles.add(1000 + value, now=start - 1)
+    quantiles.add(1, now=start + 1)
+    assert quantiles.values(now=start + 1)[0][1] > 1000
+
+    assert quantiles.values(now=start + 6) == [(0.5, 1)]
+    assert math.isnan(quantiles.values(now=start + 100)[0][1])
+
+
+def test_quantiles_must_be_between_zero_and_one() -> None:
+    with pytest.raises(ValueError) as exc:
+        SlidingQuantiles(quantiles=(0.5, 1.5))
+    assert str(exc.value) == "quantiles must be between 0 and 1."